@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import DiskCache
+
+
+def _temp_cache(**kwargs) -> DiskCache:
+    return DiskCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite"), **kwargs)
+
+
+def _compute_in_child(path, key, started):
+    # Runs in a spawned process: owns the key for a while, then stores the value.
+    cache = DiskCache(path)
+    with cache.flight(key) as flight:
+        assert flight.value is None and flight.token
+        started.set()
+        time.sleep(0.6)
+        cache.set(key, "from child")
+
+
+def test_waiter_in_same_process_gets_computed_value():
+    cache = _temp_cache()
+    owned = threading.Event()
+
+    def compute():
+        with cache.flight("k") as flight:
+            owned.set()
+            time.sleep(0.3)
+            cache.set("k", "v")
+
+    thread = threading.Thread(target=compute)
+    thread.start()
+    owned.wait()
+    flight = cache.claim("k")
+    thread.join()
+    assert flight.value == "v" and flight.token is None
+    assert cache.waits == 1
+
+
+def test_waiter_in_other_process_gets_computed_value():
+    path = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+    cache = DiskCache(path)
+    context = multiprocessing.get_context("spawn")
+    started = context.Event()
+    child = context.Process(target=_compute_in_child, args=(path, "k", started))
+    child.start()
+    try:
+        assert started.wait(60)
+        with cache.flight("k") as flight:
+            assert flight.value == "from child" and flight.token is None
+    finally:
+        child.join(60)
+    assert child.exitcode == 0
+
+
+def test_expired_lease_is_taken_over():
+    cache = _temp_cache()
+    # A process that crashed while computing: its lease is no longer renewed.
+    cache._conn.execute("INSERT INTO flights (key, owner, process, expires, paused) VALUES ('k', 'dead:1', 'dead', ?, NULL)",
+                        (time.time() + 60,))
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.claim("k")))
+    waiter.start()
+    waiter.join(0.6)
+    assert waiter.is_alive()  # the lease still holds
+    cache._conn.execute("UPDATE flights SET expires = ? WHERE key = 'k'", (time.time() - 1,))
+    waiter.join(5)
+    assert result and result[0].value is None and result[0].token
+    cache.release(result[0])
+
+
+def test_paused_flight_is_bypassed_after_stall():
+    cache = _temp_cache()
+    with cache.flight("k") as owner:
+        with owner.paused():
+            start = time.time()
+            flight = cache.claim("k", stall_seconds=0.3)
+            assert flight.value is None and flight.token is None
+            assert 0.3 <= time.time() - start < 5
+        # Running again: stalled-only waiters must wait once more.
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(cache.claim("k", stall_seconds=0.3)))
+        waiter.start()
+        waiter.join(0.8)
+        assert waiter.is_alive()
+        cache.set("k", "v")
+    waiter.join(5)
+    assert result[0].value == "v"
+
+
+def test_running_total_matches_stored_bytes():
+    cache = _temp_cache(max_bytes=10000)
+    for i in range(50):
+        cache.set(f"k{i % 30}", "x" * (100 + i * 10))
+    stored = cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    assert cache.stats()["bytes"] == stored <= 10000
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"[OK] {name}")
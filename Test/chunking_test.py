@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chunking import TRANSLATE_CHUNK_BYTES, estimate_tokens, iter_chunks
+
+
+def test_cjk_respects_byte_budget():
+    text = "这是一个关于系统性能的句子。" * 1500
+    chunks = list(iter_chunks(text, max_bytes=TRANSLATE_CHUNK_BYTES))
+    assert len(chunks) > 1
+    assert all(len(c.encode("utf-8")) <= TRANSLATE_CHUNK_BYTES for c in chunks)
+    assert "".join(chunks) == text
+
+
+def test_unbroken_run_is_sliced():
+    text = "性能" * 20000  # no punctuation, no spaces
+    chunks = list(iter_chunks(text, max_bytes=TRANSLATE_CHUNK_BYTES, max_tokens=1000))
+    assert all(len(c.encode("utf-8")) <= TRANSLATE_CHUNK_BYTES and estimate_tokens(c) <= 1000 for c in chunks)
+    assert "".join(chunks) == text
+
+
+def test_chunks_stay_within_token_budget():
+    # Separators and per-unit rounding used to let chunks run a few percent over max_tokens.
+    paragraph = "alpha beta 这是性能。 gamma delta. epsilon! ω x"
+    text = "\n\n".join(paragraph[:i % len(paragraph) + 1] for i in range(400))
+    for max_tokens in (8, 15, 60, 250):
+        chunks = list(iter_chunks(text, max_tokens=max_tokens, overlap_tokens=5))
+        assert all(estimate_tokens(c) <= max_tokens for c in chunks), max_tokens
+
+
+def test_cjk_token_estimate():
+    assert estimate_tokens("这是一个关于系统性能的句子。") >= 13
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"[OK] {name}")
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from jobs import JOB_STALE_SECONDS, JobStore
+
+
+def _temp_store() -> JobStore:
+    return JobStore(os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+
+
+def _make_stale(store: JobStore, job_id: str):
+    # The worker stopped sending heartbeats (it died).
+    store._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - JOB_STALE_SECONDS - 1, job_id))
+
+
+def test_claim_prefers_owner_with_fewest_running_jobs():
+    store = _temp_store()
+    a1 = store.submit("alice", "one", {})
+    a2 = store.submit("alice", "two", {})
+    b1 = store.submit("bob", "three", {})
+    # alice submitted first, but bob is served before her second job.
+    assert [store.claim("w")["id"] for _ in range(3)] == [a1, b1, a2]
+    assert store.claim("w") is None
+
+
+def test_claim_returns_input_and_skips_cancelled_jobs():
+    store = _temp_store()
+    cancelled = store.submit("alice", "gone", {})
+    queued = store.submit("alice", "text", {"mode": "tree"})
+    store.cancel(cancelled)
+    job = store.claim("w")
+    assert job["id"] == queued and job["input"] == "text" and job["params"] == {"mode": "tree"}
+    assert store.get(cancelled)["status"] == "cancelled"
+
+
+def test_stale_job_is_requeued_then_given_up():
+    store = _temp_store()
+    job_id = store.submit("alice", "text", {})
+    store.claim("w1")
+    _make_stale(store, job_id)
+    job = store.claim("w2")
+    assert job["id"] == job_id and store.get(job_id)["attempts"] == 2
+
+    _make_stale(store, job_id)
+    assert store.claim("w3") is None
+    job = store.get(job_id)
+    assert job["status"] == "error" and job["error"] == "Worker lost"
+
+
+def test_live_job_is_not_requeued():
+    store = _temp_store()
+    job_id = store.submit("alice", "text", {})
+    store.claim("w1")
+    store.heartbeat(job_id, 0.5, "Working", "partial")
+    assert store.claim("w2") is None
+    job = store.get(job_id)
+    assert job["status"] == "running" and job["partial"] == "partial"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"[OK] {name}")
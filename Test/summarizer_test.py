@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmark import FakeGroq
+from summarizer import RateLimiter, summarize_chunks
+
+# Generous enough that the limiter never waits.
+LIMITER = RateLimiter(10**6, 10**9)
+
+
+class SlowFirstGroq(FakeGroq):
+    """Answers the first part last, so parts finish out of order."""
+
+    def create(self, model, messages, stream=False, **kwargs):
+        if messages[-1]["content"].startswith("part0 "):
+            time.sleep(0.3)
+        return super().create(model, messages, stream=stream, **kwargs)
+
+
+class FailingGroq(FakeGroq):
+    """Fails parts containing "bad" with an error that is not retried."""
+
+    def create(self, model, messages, stream=False, **kwargs):
+        if "bad" in messages[-1]["content"]:
+            raise ValueError("model refused")
+        return super().create(model, messages, stream=stream, **kwargs)
+
+
+def _chunks(count: int) -> list:
+    return [f"part{i} " + "words " * 20 for i in range(count)]
+
+
+def test_summaries_keep_part_order():
+    chunks = _chunks(6)
+    progress = []
+    results = summarize_chunks(chunks, SlowFirstGroq(ttft=0.01, output_words=5), limiter=LIMITER, max_workers=3,
+                               on_progress=lambda done, total: progress.append(done))
+    assert [r.split()[0] for r in results] == [f"part{i}" for i in range(6)]
+    assert progress[-1] == 6
+
+
+def test_streamed_parts_keep_part_order():
+    streamed = {}
+
+    def on_token(i, delta):
+        if delta is None:
+            streamed[i] = ""
+        else:
+            streamed[i] = streamed.get(i, "") + delta
+
+    results = summarize_chunks(iter(_chunks(4)), SlowFirstGroq(ttft=0.01, output_words=5), limiter=LIMITER,
+                               max_workers=2, on_token=on_token)
+    assert [streamed[i] for i in range(4)] == results
+    assert results[0].startswith("part0")
+
+
+def test_failed_part_is_reported_and_left_empty():
+    chunks = _chunks(4)
+    chunks[2] = "bad " + chunks[2]
+    errors = []
+    results = summarize_chunks(chunks, FailingGroq(ttft=0.01, output_words=5), limiter=LIMITER, max_workers=2,
+                               on_error=lambda i, e: errors.append((i, str(e))))
+    assert errors == [(2, "model refused")]
+    assert results[2] is None and all(results[i] for i in (0, 1, 3))
+
+
+def test_upstream_error_is_raised_after_submitted_parts():
+    client = FakeGroq(ttft=0.01, output_words=5)
+
+    def chunks():
+        yield from _chunks(3)
+        raise RuntimeError("extraction failed")
+
+    try:
+        summarize_chunks(chunks(), client, limiter=LIMITER, max_workers=2)
+    except RuntimeError as e:
+        assert str(e) == "extraction failed"
+    else:
+        raise AssertionError("upstream error was swallowed")
+    assert client.requests == 3
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"[OK] {name}")
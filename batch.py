@@ -0,0 +1,265 @@
+"""
+Précis - Headless Batch Summarizer
+Runs extract -> translate -> summarize over a directory or manifest of documents,
+without Streamlit. Stages run concurrently on their own worker threads, so one file can
+be OCR'd while another is being translated or summarized. Within a document, pages stream
+through the stages too: early parts are summarized while later pages are still being
+extracted and translated.
+Results are appended to a JSONL file as each document finishes; re-running with the same
+output skips documents that already completed.
+
+Usage:
+    python batch.py ./documents --output results.jsonl [--translate] [--mode tree]
+    python batch.py manifest.txt --output results.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from ocr import IMAGE_EXTENSIONS, OCR_QUALITY, OCR_TIERS, SUPPORTED_EXTENSIONS, describe_methods, iter_document_pages, ocr_cache
+from pipeline import StageError, drain, feed, labelled, prefetch, start_stage
+from summarizer import shared_limiter, summarize_text, summary_cache
+from translation import BACKENDS, TRANSLATE_BACKEND, get_backend, stream_translate, translation_memory
+
+# Pages extracted ahead of translation/summarization, per document.
+PAGE_LOOKAHEAD = 8
+
+
+def list_inputs(source: str) -> list:
+    """Documents under a directory (recursive), or the paths listed in a manifest.
+    A manifest is a text file with one path per line, or JSONL with a "path" field;
+    relative paths are resolved against the manifest's directory."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+
+def load_completed(output_path: str) -> set:
+    """Paths already summarized successfully in an earlier (possibly crashed) run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            if record.get("status") == "ok":
+                completed.add(record["path"])
+    return completed
+
+
+class BatchRunner:
+    def __init__(self, client, translate: bool = False, target_language: str = 'en', mode: str = "sections",
+                 translator: str = None, ocr_quality: str = OCR_QUALITY, source_language: str = 'auto'):
+        self.client = client
+        self.translate = translate
+        self.target_language = target_language
+        self.source_language = source_language
+        self.mode = mode
+        self.translator = get_backend(translator)
+        self.ocr_quality = ocr_quality
+        self._slots = {}  # stage -> semaphore bounding documents in flight, set by run()
+        self._slots_lock = threading.Lock()
+
+    def _stage(self, item: dict, stage: str, fn):
+        """Runs one stage for an item unless an earlier stage failed."""
+        if item.get("error"):
+            return item
+        try:
+            fn(item)
+        except StageError as e:
+            item["error"] = str(e)  # raised by an upstream stage while its pages were being read
+        except Exception as e:
+            item["error"] = f"{stage}: {e}"
+        return item
+
+    def _finished(self, item: dict, stage: str, items):
+        """Passes items through and records when the stage produced its last one,
+        in seconds since the document started."""
+        yield from items
+        item["timings"][stage] = round(time.perf_counter() - item["started"], 3)
+
+    def _hold(self, item: dict, stage: str):
+        """Waits for one of the stage's slots; the document keeps it until its pages for that stage are drained."""
+        self._slots[stage].acquire()
+        with self._slots_lock:
+            item.setdefault("held", set()).add(stage)
+
+    def _release(self, item: dict, *stages):
+        """Gives back the document's slots for stages (default: all it still holds)."""
+        with self._slots_lock:
+            held = item.get("held", set())
+            released = [stage for stage in (stages or list(held)) if stage in held]
+            held.difference_update(released)
+        for stage in released:
+            self._slots[stage].release()
+
+    def _releasing(self, item: dict, stage: str, items):
+        try:
+            yield from items
+        finally:
+            self._release(item, stage)
+
+    def _pages(self, item: dict, data: bytes):
+        pages = []
+        for page in iter_document_pages(item["path"], data, cache=ocr_cache(), quality=self.ocr_quality):
+            pages.append({"page": page["page"], "method": page["method"]})
+            item["chars"] += len(page["text"])
+            yield page["text"]
+        if item["path"].lower().endswith((".pdf",) + IMAGE_EXTENSIONS):
+            item["extraction"] = describe_methods(pages)
+
+    def extract(self, item: dict) -> dict:
+        def run(item):
+            self._hold(item, "extract")
+            with open(item["path"], "rb") as f:
+                data = f.read()
+            item["sha256"] = hashlib.sha256(data).hexdigest()
+            item["started"], item["chars"] = time.perf_counter(), 0
+            # Extraction starts now on its own thread and runs at most PAGE_LOOKAHEAD pages ahead.
+            pages = self._releasing(item, "extract", self._finished(item, "extract", self._pages(item, data)))
+            item["pages"] = prefetch(labelled(pages, "extract"), PAGE_LOOKAHEAD)
+        return self._stage(item, "extract", run)
+
+    def translate_item(self, item: dict) -> dict:
+        def run(item):
+            self._hold(item, "translate")
+            translated = stream_translate(item["pages"], target_language=self.target_language,
+                                          source_language=self.source_language, memory=translation_memory(), backend=self.translator)
+            item["pages"] = self._releasing(item, "translate", self._finished(item, "translate", translated))
+        return self._stage(item, "translate", run) if self.translate else item
+
+    def summarize(self, item: dict) -> dict:
+        def run(item):
+            errors = []
+            summary = summarize_text(
+                item.pop("pages"), self.client, mode=self.mode,
+                limiter=shared_limiter(), cache=summary_cache(),
+                on_error=lambda i, e: errors.append(f"part {i + 1}: {e}"),
+            )
+            item["timings"]["summarize"] = round(time.perf_counter() - item["started"], 3)
+            if not item["chars"]:
+                raise RuntimeError("No readable text found")
+            item["summary"] = summary
+            if errors:
+                item["warnings"] = errors
+        return self._stage(item, "summarize", run)
+
+    def run(self, paths: list, output_path: str, extract_workers: int = 2, translate_workers: int = 2,
+            summarize_workers: int = 2) -> dict:
+        # Stage threads only hand documents on; their pages are extracted and translated on
+        # background threads later. Slots keep at most extract_workers documents extracting and
+        # translate_workers translating at once.
+        self._slots = {"extract": threading.BoundedSemaphore(max(1, extract_workers)),
+                       "translate": threading.BoundedSemaphore(max(1, translate_workers))}
+        items = ({"path": path, "timings": {}} for path in paths)
+        extracted = start_stage(self.extract, feed(items), extract_workers, name="extract")
+        translated = start_stage(self.translate_item, extracted, translate_workers, name="translate")
+        summarized = start_stage(self.summarize, translated, summarize_workers, name="summarize")
+
+        stats = {"ok": 0, "error": 0, "chars": 0, "stage_seconds": {}}
+        start = time.perf_counter()
+        with open(output_path, "a", encoding='utf-8') as out:
+            for item in drain(summarized):
+                self._release(item)  # documents that failed before their pages were drained
+                record = {
+                    "path": item["path"],
+                    "status": "error" if item.get("error") else "ok",
+                    "sha256": item.get("sha256"),
+                    "chars": item.get("chars", 0),
+                    "extraction": item.get("extraction"),
+                    "summary": item.get("summary"),
+                    "error": item.get("error"),
+                    "warnings": item.get("warnings"),
+                    "timings": item["timings"],
+                    "completed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                # One flushed line per document: a crash loses at most the documents in flight.
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+                stats[record["status"]] += 1
+                stats["chars"] += record["chars"]
+                for stage, seconds in item["timings"].items():
+                    stats["stage_seconds"][stage] = stats["stage_seconds"].get(stage, 0.0) + seconds
+                print(f"  -> [{record['status'].upper()}] {item['path']}" + (f" ({item['error']})" if item.get("error") else ""))
+
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
+
+
+def parse_args(arg_list=None):
+    parser = argparse.ArgumentParser(description="Summarize a directory or manifest of documents without the UI.")
+    parser.add_argument("source", help="Directory to scan, or a manifest file (one path per line, or JSONL with a \"path\" field).")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results file; completed documents in it are skipped.")
+    parser.add_argument("--translate", action="store_true", help="Translate to --target-language before summarizing.")
+    parser.add_argument("--source-language", default="auto",
+                        help="Language code of the documents; argos needs it unless one model into the target is installed.")
+    parser.add_argument("--target-language", default="en")
+    parser.add_argument("--translator", choices=list(BACKENDS), default=TRANSLATE_BACKEND,
+                        help="google: Google Translate over the network; argos: local offline models.")
+    parser.add_argument("--mode", choices=["sections", "tree"], default="tree",
+                        help="tree: one fixed-size summary per document; sections: one section per chunk.")
+    parser.add_argument("--ocr-quality", choices=list(OCR_TIERS) + ["auto"], default=OCR_QUALITY,
+                        help="Scanned-page OCR tier; fast is ~1.6x quicker on dense pages, auto picks per page.")
+    parser.add_argument("--extract-workers", type=int, default=2, help="Documents extracted at once.")
+    parser.add_argument("--translate-workers", type=int, default=2, help="Documents translated at once.")
+    parser.add_argument("--summarize-workers", type=int, default=2)
+    return parser.parse_args(arg_list)
+
+
+def main(arg_list=None):
+    args = parse_args(arg_list)
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        print("[SYSTEM ERROR] GROQ_API_KEY environment variable is not set.")
+        return 1
+
+    from groq import Groq
+    client = Groq(api_key=groq_api_key)
+
+    paths = list_inputs(args.source)
+    completed = load_completed(args.output)
+    pending = [p for p in paths if p not in completed]
+    print(f"[SYSTEM] {len(paths)} documents found, {len(paths) - len(pending)} already completed, {len(pending)} to process.")
+    if not pending:
+        return 0
+
+    runner = BatchRunner(client, translate=args.translate, target_language=args.target_language, mode=args.mode,
+                         translator=args.translator, ocr_quality=args.ocr_quality,
+                         source_language=args.source_language)
+    stats = runner.run(pending, args.output, args.extract_workers, args.translate_workers, args.summarize_workers)
+
+    elapsed = stats["elapsed"]
+    done = stats["ok"] + stats["error"]
+    print("\n==========================================")
+    print(f"Processed {done} documents in {elapsed:.1f} seconds ({stats['ok']} ok, {stats['error']} failed)")
+    print(f"Throughput: {done / elapsed * 60:.2f} documents/min, {stats['chars'] / elapsed:,.0f} characters/s")
+    for stage, seconds in stats["stage_seconds"].items():
+        print(f"  {stage:<10} done {seconds / max(1, done):.2f} s after a document starts, on average")
+    return 0 if stats["error"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,448 @@
+"""
+Précis - Benchmarks
+Reproducible timings for chunking, OCR, translation, summarization and chat memory.
+Groq and the translator are replaced by local fakes with configurable latency and rate
+limits, so the suite runs offline and measures the orchestration, not the network.
+Results are printed and written as JSON; --compare flags benchmarks that got slower.
+
+Usage:
+    python benchmark.py --output bench_results.json [--only chunking,summarize] [--repeat 3]
+    python benchmark.py --compare baseline.json bench_results.json [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import summarizer
+import translation
+from cache import DiskCache
+from chat_context import FastContextManager
+from chunking import SUMMARY_CHUNK_TOKENS, TRANSLATE_CHUNK_BYTES, count_tokens, iter_chunks
+from retrieval import build_index
+from summarizer import RateLimiter, summarize_text
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test")
+SAMPLE_PDF = os.path.join(TEST_DIR, "Copy of Grey Modern Professional CV Resume (1).pdf")
+SAMPLE_IMAGE = os.path.join(TEST_DIR, "sample_spanish_document.jpg")
+
+
+# ---------------------------------------------------------------------------
+# Local Stand-ins
+# ---------------------------------------------------------------------------
+class FakeRateLimitError(Exception):
+    """Shaped like a Groq 429 so the app's retry handling treats it the same way."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit reached (fake)")
+        self.status_code = 429
+        self.response = type("Response", (), {"headers": {"retry-after": f"{retry_after:.3f}"}})()
+
+
+class _SlidingWindow:
+    """Allows `limit` calls per `window` seconds; over the limit, check() raises a 429."""
+
+    def __init__(self, limit: int = None, window: float = 60.0):
+        self.limit = limit
+        self.window = window
+        self.calls = deque()
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def check(self):
+        if not self.limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] >= self.window:
+                self.calls.popleft()
+            if len(self.calls) >= self.limit:
+                self.rejected += 1
+                raise FakeRateLimitError(self.window - (now - self.calls[0]))
+            self.calls.append(now)
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeGroq:
+    """
+    Minimal stand-in for groq.Groq: client.chat.completions.create(model, messages, stream=False).
+    Replies after `ttft` seconds and then produces `output_words` words at `words_per_sec`.
+    With rate_limit=(requests, seconds), extra requests in the window fail with a 429.
+    """
+
+    def __init__(self, ttft: float = 0.05, words_per_sec: float = 2000, output_words: int = 120,
+                 rate_limit: tuple = None):
+        self.ttft = ttft
+        self.words_per_sec = words_per_sec
+        self.output_words = output_words
+        self.limiter = _SlidingWindow(*rate_limit) if rate_limit else _SlidingWindow()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.chat = _Obj(completions=_Obj(create=self.create))
+
+    def _reply(self, messages: list) -> list:
+        words = messages[-1]["content"].split() or ["(empty)"]
+        return [words[i % len(words)] for i in range(self.output_words)]
+
+    def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.limiter.check()
+        with self._lock:
+            self.requests += 1
+        words = self._reply(messages)
+        time.sleep(self.ttft)
+        if not stream:
+            time.sleep(len(words) / self.words_per_sec)
+            return _Obj(choices=[_Obj(message=_Obj(content=" ".join(words)))])
+
+        def events():
+            for word in words:
+                time.sleep(1 / self.words_per_sec)
+                yield _Obj(choices=[_Obj(delta=_Obj(content=word + " "))])
+        return events()
+
+
+class FakeTranslator:
+    """Stand-in for deep_translator.GoogleTranslator: upper-cases text after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.02, rate_limit: tuple = None):
+        self.latency = latency
+        self.limiter = _SlidingWindow(*rate_limit) if rate_limit else _SlidingWindow()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text: str) -> str:
+        self.limiter.check()
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+        return text.upper()
+
+
+def install_translator(fake: FakeTranslator):
+    """Routes translation.py's per-thread translators to the fake. Returns the original hook."""
+    original = translation._thread_translator
+    translation._thread_translator = lambda source_language, target_language: fake
+    return original
+
+
+def sample_document(pages: int = 120, seed: int = 0) -> str:
+    """Deterministic pseudo-text: pages of paragraphs of sentences, joined with form feeds."""
+    rng = random.Random(seed)
+    vocabulary = [
+        "system", "latency", "throughput", "model", "document", "summary", "page", "token", "budget",
+        "request", "worker", "queue", "cache", "result", "analysis", "report", "figure", "value",
+        "revenue", "quarter", "growth", "policy", "contract", "section", "clause", "risk", "data",
+    ]
+    out = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(rng.randint(4, 8)):
+            sentences = [
+                " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 20))).capitalize() + "."
+                for _ in range(rng.randint(3, 6))
+            ]
+            paragraphs.append(" ".join(sentences))
+        out.append("\n\n".join(paragraphs))
+    return "\f".join(out)
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+# Each bench_* function does its setup and returns {name: fn}; fn() is what gets timed,
+# and the counters it returns are recorded alongside the timings.
+def bench_chunking(doc: str) -> dict:
+    def summary_chunks():
+        return {"chunks": sum(1 for _ in iter_chunks(doc, max_tokens=SUMMARY_CHUNK_TOKENS))}
+
+    def translate_chunks():
+        return {"chunks": sum(1 for _ in iter_chunks(doc, max_bytes=TRANSLATE_CHUNK_BYTES))}
+
+    def passages():
+        return {"chunks": sum(1 for _ in iter_chunks(doc, max_tokens=250, overlap_tokens=40))}
+
+    def tokens():
+        return {"tokens": sum(count_tokens(page) for page in doc.split("\f"))}
+
+    return {
+        "chunking.summary_budget": summary_chunks,
+        "chunking.translate_budget": translate_chunks,
+        "chunking.retrieval_passages": passages,
+        "chunking.count_tokens": tokens,
+    }
+
+
+def bench_ocr() -> dict:
+    from ocr import create_ocr_engine, extract_pdf_pages, iter_image_pages, ocr_image
+
+    with open(SAMPLE_PDF, "rb") as f:
+        pdf_bytes = f.read()
+    engine = create_ocr_engine()
+
+    def text_layer():
+        pages = extract_pdf_pages(pdf_bytes)
+        return {"pages": len(pages), "chars": sum(len(p["text"]) for p in pages)}
+
+    def forced_ocr(quality="balanced"):
+        pages = extract_pdf_pages(pdf_bytes, force_ocr=True, quality=quality, engine=engine, workers=1)
+        return {"pages": len(pages), "chars": sum(len(p["text"]) for p in pages)}
+
+    def image():
+        import cv2
+        return {"chars": len(ocr_image(engine, cv2.imread(SAMPLE_IMAGE)))}
+
+    def image_upload():
+        # The upload path: EXIF rotation and downscaling before OCR.
+        with open(SAMPLE_IMAGE, "rb") as f:
+            pages = list(iter_image_pages(f.read(), workers=1))
+        return {"pages": len(pages), "chars": sum(len(p["text"]) for p in pages)}
+
+    return {"ocr.pdf_text_layer": text_layer, "ocr.pdf_forced": forced_ocr,
+            "ocr.pdf_forced_fast": lambda: forced_ocr("fast"), "ocr.pdf_forced_accurate": lambda: forced_ocr("accurate"),
+            "ocr.pdf_forced_auto": lambda: forced_ocr("auto"), "ocr.image": image, "ocr.image_upload": image_upload}
+
+
+def bench_translation(doc: str, latency: float) -> dict:
+    def run(memory=None, rate_limit=None):
+        fake = FakeTranslator(latency=latency, rate_limit=rate_limit)
+        original = install_translator(fake)
+        try:
+            text = translation.translate_text(doc, memory=memory)
+        finally:
+            translation._thread_translator = original
+        return {"requests": fake.requests, "rate_limited": fake.limiter.rejected,
+                "failed_chunks": text.count(translation.TRANSLATION_ERROR_MARKER)}
+
+    def cold():
+        return run()
+
+    # A translation memory already holding this document: repeats should not reach the translator.
+    memory = DiskCache(os.path.join(tempfile.mkdtemp(prefix="precis-bench-"), "tm.sqlite"))
+    run(memory)
+
+    def memory_warm():
+        memory.hits = 0
+        counters = run(memory)
+        counters["memory_hits"] = memory.hits
+        return counters
+
+    def rate_limited():
+        return run(rate_limit=(20, 0.5))
+
+    return {"translate.cold": cold, "translate.memory_warm": memory_warm, "translate.rate_limited": rate_limited}
+
+
+def bench_summarize(doc: str, ttft: float, words_per_sec: float) -> dict:
+    # A limiter loose enough that only the fake's own limit (if any) throttles.
+    def run(mode="sections", stream=False, rate_limit=None):
+        client = FakeGroq(ttft=ttft, words_per_sec=words_per_sec, rate_limit=rate_limit)
+        tokens = [0]
+        on_token = (lambda i, delta: tokens.__setitem__(0, tokens[0] + 1)) if stream else None
+        errors = []
+        summarize_text(doc, client, mode=mode, limiter=RateLimiter(10 ** 6, 10 ** 9),
+                       on_token=on_token, on_error=lambda i, e: errors.append(e))
+        counters = {"requests": client.requests, "rate_limited": client.limiter.rejected, "errors": len(errors)}
+        if stream:
+            counters["deltas"] = tokens[0]
+        return counters
+
+    def streamed_pages():
+        client = FakeGroq(ttft=ttft, words_per_sec=words_per_sec)
+
+        def pages():
+            for page in doc.split("\f"):
+                time.sleep(0.005)  # a page arriving from extraction
+                yield page
+        summarize_text(pages(), client, limiter=RateLimiter(10 ** 6, 10 ** 9))
+        return {"requests": client.requests}
+
+    return {
+        "summarize.sections": lambda: run(),
+        "summarize.sections_streamed": lambda: run(stream=True),
+        "summarize.tree": lambda: run(mode="tree"),
+        "summarize.rate_limited": lambda: run(rate_limit=(4, 0.5)),
+        "summarize.page_stream": streamed_pages,
+    }
+
+
+def bench_chat(doc: str, ttft: float, words_per_sec: float) -> dict:
+    index = build_index(doc.replace("\f", "\n\n"))
+    questions = [f"What does the document say about {w} and budget?" for w in ("latency", "revenue", "risk", "cache")]
+
+    def build():
+        return {"passages": len(build_index(doc.replace("\f", "\n\n")))}
+
+    def search():
+        for _ in range(50):
+            for q in questions:
+                index.search(q)
+        return {"queries": 50 * len(questions)}
+
+    def add_messages():
+        manager = FastContextManager(max_tokens=4000, client=FakeGroq())
+        manager.add_message("system", doc[:4000])
+        for i in range(2000):
+            manager.add_message("user" if i % 2 == 0 else "assistant", doc[i * 50:i * 50 + 400])
+        return {"messages": 2000, "kept": len(manager.messages)}
+
+    def conversation():
+        client = FakeGroq(ttft=ttft, words_per_sec=words_per_sec)
+        manager = FastContextManager(max_tokens=4000, client=client, retriever=index)
+        manager.add_message("system", doc[:4000])
+        # generate_response paces itself on the shared limiter; give it a loose one for the run.
+        original = summarizer._shared_limiter
+        summarizer._shared_limiter = RateLimiter(10 ** 6, 10 ** 9)
+        try:
+            for i in range(12):
+                manager.generate_response(questions[i % len(questions)])
+        finally:
+            summarizer._shared_limiter = original
+        return {"turns": 12, "requests": client.requests}
+
+    return {
+        "chat.build_index": build,
+        "chat.search": search,
+        "chat.add_message": add_messages,
+        "chat.conversation": conversation,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+GROUPS = ("chunking", "ocr", "translate", "summarize", "chat")
+
+
+def collect_benchmarks(groups: list, args) -> tuple:
+    """Returns ({name: fn}, {group: reason}) for the selected groups; groups whose
+    dependencies are missing are reported as skipped."""
+    doc = sample_document(args.pages)
+    benchmarks, skipped = {}, {}
+    for group in groups:
+        try:
+            if group == "chunking":
+                benchmarks.update(bench_chunking(doc))
+            elif group == "ocr":
+                benchmarks.update(bench_ocr())
+            elif group == "translate":
+                benchmarks.update(bench_translation(doc, args.translate_latency))
+            elif group == "summarize":
+                benchmarks.update(bench_summarize(doc, args.groq_ttft, args.groq_words_per_sec))
+            elif group == "chat":
+                benchmarks.update(bench_chat(doc, args.groq_ttft, args.groq_words_per_sec))
+        except Exception as e:
+            skipped[group] = str(e)
+    return benchmarks, skipped
+
+
+def run_benchmark(fn, repeat: int) -> dict:
+    times, counters = [], {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counters = fn() or {}
+        times.append(time.perf_counter() - start)
+    return {
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "runs": repeat,
+        "counters": counters,
+    }
+
+
+def compare(baseline_path: str, current_path: str, tolerance: float) -> int:
+    """Prints the change per benchmark; returns 1 if any median got slower than the tolerance allows."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline_report = json.load(f)
+    with open(current_path, encoding='utf-8') as f:
+        current_report = json.load(f)
+    if baseline_report["meta"]["config"] != current_report["meta"]["config"]:
+        print("[SYSTEM] Warning: the two runs used different settings; timings may not be comparable.")
+    baseline, current = baseline_report["results"], current_report["results"]
+
+    regressions = 0
+    for name, result in current.items():
+        if name not in baseline:
+            print(f"  {name:<32} (new)")
+            continue
+        before, after = baseline[name]["median_s"], result["median_s"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = "  <-- REGRESSION"
+        print(f"  {name:<32} {before:9.4f}s -> {after:9.4f}s ({change:+.0%}){flag}")
+    print(f"\n{regressions} regression(s) beyond {tolerance:.0%}.")
+    return 1 if regressions else 0
+
+
+def parse_args(arg_list=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Précis processing layers.")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON results file.")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma-separated groups: {', '.join(GROUPS)}.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; min and median are reported.")
+    parser.add_argument("--pages", type=int, default=120, help="Pages in the synthetic document.")
+    parser.add_argument("--groq-ttft", type=float, default=0.05, help="Fake Groq time to first token (s).")
+    parser.add_argument("--groq-words-per-sec", type=float, default=2000, help="Fake Groq output speed.")
+    parser.add_argument("--translate-latency", type=float, default=0.02, help="Fake translator latency per request (s).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two results files.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown for --compare (0.2 = 20%%).")
+    return parser.parse_args(arg_list)
+
+
+def main(arg_list=None):
+    args = parse_args(arg_list)
+    if args.compare:
+        return compare(*args.compare, args.tolerance)
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        print(f"[SYSTEM ERROR] Unknown benchmark group(s): {', '.join(unknown)}")
+        return 2
+
+    benchmarks, skipped = collect_benchmarks(groups, args)
+    for group, reason in skipped.items():
+        print(f"[SYSTEM] Skipping {group}: {reason}")
+
+    results = {}
+    for name, fn in benchmarks.items():
+        try:
+            results[name] = run_benchmark(fn, args.repeat)
+        except Exception as e:
+            print(f"  {name:<32} FAILED: {e}")
+            continue
+        result = results[name]
+        print(f"  {name:<32} median {result['median_s']:9.4f}s  min {result['min_s']:9.4f}s  {result['counters']}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "tolerance")},
+        },
+        "skipped": skipped,
+        "results": results,
+    }
+    with open(args.output, "w", encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[SYSTEM] {len(results)} benchmarks written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
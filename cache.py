@@ -0,0 +1,282 @@
+"""
+Précis - Persistent Caches
+Content-addressed, SQLite-backed key/value store with LRU eviction by total size
+and entry age. Safe to share between threads and between processes (WAL mode).
+Keys can also be computed single-flight: while one caller (thread or process) computes a
+value, identical requests wait for it instead of repeating the work.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+CACHE_DIR = os.getenv("PRECIS_CACHE_DIR", ".precis_cache")
+
+# A computing process renews its leases every third of this; a crashed one loses them after it.
+FLIGHT_LEASE_SECONDS = float(os.getenv("PRECIS_FLIGHT_LEASE_SECONDS", "30"))
+FLIGHT_POLL_SECONDS = 0.25
+# Waiters that allow it give up on a computation paused this long by its reader, and compute themselves.
+FLIGHT_STALL_SECONDS = float(os.getenv("PRECIS_FLIGHT_STALL_SECONDS", "15"))
+
+
+def make_key(*parts) -> str:
+    """SHA-256 over the JSON encoding of the key parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Key/value cache stored in one SQLite file. Least recently used entries are evicted
+    once the stored values exceed max_bytes; entries older than max_age_days expire.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, max_age_days: float = 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self._lock = threading.Lock()
+        self._owner = uuid.uuid4().hex
+        self._flights = {}  # key -> Event set when this process stops computing it
+        self._renewer = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created)")
+        # Running total of stored bytes, kept by triggers so every process sees the same figure
+        # without summing the table on each write.
+        self._conn.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO totals (name, value) VALUES ('bytes', (SELECT COALESCE(SUM(size), 0) FROM entries));
+            CREATE TRIGGER IF NOT EXISTS entries_bytes_insert AFTER INSERT ON entries
+                BEGIN UPDATE totals SET value = value + NEW.size WHERE name = 'bytes'; END;
+            CREATE TRIGGER IF NOT EXISTS entries_bytes_update AFTER UPDATE OF size ON entries
+                BEGIN UPDATE totals SET value = value + NEW.size - OLD.size WHERE name = 'bytes'; END;
+            CREATE TRIGGER IF NOT EXISTS entries_bytes_delete AFTER DELETE ON entries
+                BEGIN UPDATE totals SET value = value - OLD.size WHERE name = 'bytes'; END;
+            COMMIT;
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS flights (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                process TEXT NOT NULL,
+                expires REAL NOT NULL,
+                paused REAL
+            )
+        """)
+
+    def get(self, key: str):
+        return self._get(key, count=True)
+
+    def _get(self, key: str, count: bool):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += count
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += count
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            # An upsert, not INSERT OR REPLACE: REPLACE deletes without firing the delete trigger.
+            self._conn.execute(
+                "INSERT INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "created = excluded.created, accessed = excluded.accessed",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+        total = self._total()
+        if total <= self.max_bytes:
+            return
+        # Trim down to 90% so eviction does not run on every insert once full.
+        excess = total - int(self.max_bytes * 0.9)
+        freed, doomed = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def _total(self) -> int:
+        return self._conn.execute("SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+
+    # -----------------------------------------------------------------------
+    # Single-flight
+    # -----------------------------------------------------------------------
+    def claim(self, key: str, stall_seconds: float = None) -> "Flight":
+        """
+        Returns a Flight holding the cached value, waiting while another thread or process
+        computes it. Its value is None when the caller should compute the value itself; if the
+        flight owns the key, the caller must set() the value (if it has one) and release() it.
+        With stall_seconds, waiting stops once the computation has been paused (see
+        Flight.paused) for that long, and the caller computes without owning the key.
+        """
+        value = self.get(key)
+        waited = False
+        while value is None:
+            with self._lock:
+                event = self._flights.get(key)
+                if event is None:
+                    token = self._lease(key)
+                    if token:
+                        self._flights[key] = threading.Event()
+                        return Flight(self, key, None, token)
+                if stall_seconds is not None and self._stalled(key, stall_seconds):
+                    return Flight(self, key, None, None)
+            # Computed in this process: wake up when it finishes. Elsewhere: poll.
+            if event is not None:
+                event.wait(FLIGHT_POLL_SECONDS * 4)
+            else:
+                time.sleep(FLIGHT_POLL_SECONDS)
+            waited = True
+            value = self._get(key, count=False)
+        if waited:
+            with self._lock:
+                self.waits += 1
+        return Flight(self, key, value, None)
+
+    def release(self, flight: "Flight"):
+        """Gives up a key owned by a claim(); waiters read the value or, if none was set, one of them computes it."""
+        if flight.token is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (flight.key, flight.token))
+            event = self._flights.pop(flight.key, None)
+        if event is not None:
+            event.set()
+
+    @contextmanager
+    def flight(self, key: str, stall_seconds: float = None):
+        """
+        claim()/release() as a block:
+            with cache.flight(key) as flight:
+                if flight.value is None:
+                    cache.set(key, compute())
+        """
+        flight = self.claim(key, stall_seconds)
+        try:
+            yield flight
+        finally:
+            self.release(flight)
+
+    def _lease(self, key: str) -> str:
+        # Called with self._lock held. Takes the key unless another claim holds an unexpired lease;
+        # returns the new claim's token, or None.
+        now = time.time()
+        token = f"{self._owner}:{uuid.uuid4().hex[:8]}"
+        cursor = self._conn.execute(
+            "INSERT INTO flights (key, owner, process, expires, paused) VALUES (?, ?, ?, ?, NULL) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, process = excluded.process, "
+            "expires = excluded.expires, paused = NULL WHERE flights.expires < ?",
+            (key, token, self._owner, now + FLIGHT_LEASE_SECONDS, now),
+        )
+        if cursor.rowcount and self._renewer is None:
+            self._renewer = threading.Thread(target=self._renew_leases, name="cache-lease-renewer", daemon=True)
+            self._renewer.start()
+        return token if cursor.rowcount else None
+
+    def _stalled(self, key: str, stall_seconds: float) -> bool:
+        # Called with self._lock held.
+        row = self._conn.execute("SELECT paused FROM flights WHERE key = ?", (key,)).fetchone()
+        return bool(row and row[0] is not None and time.time() - row[0] > stall_seconds)
+
+    def _set_paused(self, flight: "Flight", paused: float):
+        with self._lock:
+            self._conn.execute("UPDATE flights SET paused = ? WHERE key = ? AND owner = ?",
+                               (paused, flight.key, flight.token))
+
+    def _renew_leases(self):
+        # Keeps this process's leases alive however long a computation takes (rate limits, large scans).
+        while True:
+            time.sleep(FLIGHT_LEASE_SECONDS / 3)
+            with self._lock:
+                if self._flights:
+                    self._conn.execute("UPDATE flights SET expires = ? WHERE process = ?",
+                                       (time.time() + FLIGHT_LEASE_SECONDS, self._owner))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self._total()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses, "waits": self.waits}
+
+
+class Flight:
+    """One claim on a cache key (see DiskCache.claim). value is the cached value, or None if the
+    caller must compute it; token is set when this claim owns the key."""
+
+    def __init__(self, cache: DiskCache, key: str, value, token: str):
+        self.cache = cache
+        self.key = key
+        self.value = value
+        self.token = token
+
+    @contextmanager
+    def paused(self):
+        """
+        Marks the computation as waiting on its consumer, e.g. a generator suspended at yield:
+            with flight.paused():
+                yield page
+        Waiters with a stall_seconds limit stop waiting for a paused computation, so a reader
+        that never resumes it cannot block them.
+        """
+        if self.token is None:
+            yield
+            return
+        self.cache._set_paused(self, time.time())
+        try:
+            yield
+        finally:
+            self.cache._set_paused(self, None)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def shared_cache(name: str, **kwargs) -> DiskCache:
+    """One DiskCache per name per process, stored under CACHE_DIR."""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(os.path.join(CACHE_DIR, f"{name}.sqlite"), **kwargs)
+        return _caches[name]
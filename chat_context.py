@@ -0,0 +1,170 @@
+"""
+Précis - Chat Memory
+Sliding-window chat context budgeted in model tokens.
+Token counts are computed once per message with a local tokenizer. Pinned messages
+(the system instruction holding the document summary) are never evicted.
+Optionally, evicted turns are folded into a short rolling summary so long chats keep
+a fixed token cost per request. With a retriever, each question is sent along with the
+most relevant source passages; they are not kept in memory.
+"""
+
+import os
+import time
+from collections import deque
+
+from chunking import count_tokens
+from metrics import span
+from retrieval import RETRIEVAL_TOP_K, format_passages
+from summarizer import EXPECTED_OUTPUT_TOKENS, MODEL_NAME, complete_chat, iter_deltas, shared_limiter
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "8000"))
+
+# Role markers and separators the chat template adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+RETRIEVAL_PROMPT = "Excerpts from the source document that may be relevant to the next question:\n\n"
+
+COMPACTION_PROMPT = """
+    You maintain the memory of a conversation about a document.
+    Merge the previous memory and the new conversation turns into one short summary.
+    Keep user goals, facts established, numbers and open questions. Drop pleasantries.
+    Keep the result under {max_words} words.
+    """
+
+
+class FastContextManager:
+    def __init__(self, max_tokens=CHAT_CONTEXT_TOKENS, compaction=False, summary_tokens=300, client=None,
+                 retriever=None, top_k=RETRIEVAL_TOP_K, metrics_run=None):
+        self.pinned = []
+        self.messages = deque()
+        self.current_tokens = 0
+        self.max_tokens = max_tokens
+        self.compaction = compaction
+        self.summary_tokens = summary_tokens
+        self.rolling_summary = None
+        self._evicted = []
+        if client is None:
+            from groq import Groq
+            client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.client = client
+        self.retriever = retriever
+        self.top_k = top_k
+        self.last_timing = None
+        self.metrics_run = metrics_run
+
+    def _make_message(self, role: str, content: str) -> dict:
+        return {"role": role, "content": content, "tokens": count_tokens(content) + MESSAGE_OVERHEAD_TOKENS}
+
+    def add_message(self, role: str, content: str, pinned: bool = None):
+        """Adds a message and evicts the oldest unpinned turns until the budget fits.
+        System messages are pinned unless pinned=False is passed."""
+        msg = self._make_message(role, content)
+        self.current_tokens += msg["tokens"]
+        if pinned if pinned is not None else role == "system":
+            self.pinned.append(msg)
+        else:
+            self.messages.append(msg)
+
+        # Always keep the newest turn, even if it alone exceeds the budget.
+        while self.current_tokens > self.max_tokens and len(self.messages) > 1:
+            oldest_msg = self.messages.popleft()
+            self.current_tokens -= oldest_msg["tokens"]
+            if self.compaction:
+                self._evicted.append(oldest_msg)
+
+    def _set_rolling_summary(self, text: str):
+        if self.rolling_summary is not None:
+            self.current_tokens -= self.rolling_summary["tokens"]
+        self.rolling_summary = self._make_message("system", f"Summary of the earlier conversation:\n{text}")
+        self.current_tokens += self.rolling_summary["tokens"]
+
+    def compact(self):
+        """Folds turns evicted since the last call into the rolling summary (one Groq call)."""
+        if not self._evicted:
+            return
+        turns = "\n".join(f"{m['role']}: {m['content']}" for m in self._evicted)
+        previous = self.rolling_summary["content"] if self.rolling_summary else "(none)"
+        prompt = COMPACTION_PROMPT.format(max_words=int(self.summary_tokens * 0.75))
+        try:
+            result = complete_chat(self.client, [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": f"Previous memory:\n{previous}\n\nNew turns:\n{turns}"},
+            ])
+        except Exception:
+            # Losing the evicted turns is the pre-compaction behaviour, so it is a safe fallback.
+            self._evicted = []
+            return
+        self._evicted = []
+        self._set_rolling_summary(result["text"])
+
+        # The summary itself takes budget; evict further if needed (without re-compacting).
+        while self.current_tokens > self.max_tokens and len(self.messages) > 1:
+            self.current_tokens -= self.messages.popleft()["tokens"]
+
+    def payload(self) -> list:
+        """Messages to send: pinned first, then the rolling summary, then recent turns."""
+        context = list(self.pinned)
+        if self.rolling_summary is not None:
+            context.append(self.rolling_summary)
+        context.extend(self.messages)
+        return [{"role": msg["role"], "content": msg["content"]} for msg in context]
+
+    def _prepare(self, user_prompt: str, stats) -> list:
+        self.add_message("user", user_prompt)
+        if self.compaction:
+            self.compact()
+        api_payload = self.payload()
+        request_tokens = self.current_tokens
+
+        passages = 0
+        if self.retriever is not None:
+            results = self.retriever.search(user_prompt, self.top_k)
+            if results:
+                passages = len(results)
+                excerpts = RETRIEVAL_PROMPT + format_passages(results)
+                # Just before the question, so the excerpts are the freshest context.
+                api_payload.insert(len(api_payload) - 1, {"role": "system", "content": excerpts})
+                request_tokens += count_tokens(excerpts) + MESSAGE_OVERHEAD_TOKENS
+
+        wait = shared_limiter().acquire(request_tokens + EXPECTED_OUTPUT_TOKENS)
+        stats.set(tokens_in=request_tokens, passages=passages, wait=wait)
+        return api_payload
+
+    def _finish(self, stats, text: str, ttft: float, latency: float):
+        self.last_timing = {"ttft": ttft, "latency": latency}
+        stats.set(tokens_out=count_tokens(text), ttft=ttft)
+        self.add_message("assistant", text)
+
+    def generate_response(self, user_prompt: str) -> str:
+        with span("chat", run=self.metrics_run) as stats:
+            api_payload = self._prepare(user_prompt, stats)
+
+            try:
+                result = complete_chat(self.client, api_payload)
+            except Exception as e:
+                stats.set(failed=True)
+                return f"[Error connecting to Groq API: {e}]"
+            self._finish(stats, result["text"], result["ttft"], result["latency"])
+            return result["text"]
+
+    def generate_response_stream(self, user_prompt: str):
+        """Yields the reply as it is generated. The complete reply is added to memory at the end,
+        so the stored conversation matches generate_response."""
+        with span("chat", run=self.metrics_run, stream=True) as stats:
+            api_payload = self._prepare(user_prompt, stats)
+
+            start, ttft, parts = time.perf_counter(), None, []
+            try:
+                stream = self.client.chat.completions.create(messages=api_payload, model=MODEL_NAME, stream=True)
+                for delta in iter_deltas(stream):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta)
+                    yield delta
+            except Exception as e:
+                stats.set(failed=True)
+                yield f"[Error connecting to Groq API: {e}]"
+                return
+
+            latency = time.perf_counter() - start
+            self._finish(stats, "".join(parts), ttft if ttft is not None else latency, latency)
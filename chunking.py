@@ -0,0 +1,184 @@
+"""
+Précis - Text Chunking
+Lazily splits documents into chunks on page, paragraph and sentence boundaries.
+Chunks are budgeted by estimated model tokens (for Llama 3.3) and/or UTF-8 bytes
+(for the translator's request limit), and may overlap by a few trailing sentences.
+"""
+
+import os
+import re
+import threading
+
+# ~10k tokens per chunk keeps a summary request inside the Llama 3.3 context
+# and within a single minute of the free-tier tokens/min quota.
+SUMMARY_CHUNK_TOKENS = 10000
+
+# GoogleTranslator rejects requests of 5000 characters or more; bytes are the stricter measure.
+TRANSLATE_CHUNK_BYTES = 4500
+
+PAGE_BREAK = "\f"
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# CJK full stops end a sentence even without a following space (Chinese and Japanese use none).
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])\s*")
+_WORD_RE = re.compile(r"\S+\s*")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: ~4 characters per token (but about one per CJK character),
+    and never below ~1.3 tokens per word."""
+    cjk = len(_CJK_RE.findall(text))
+    return max(1, (len(text) - cjk) // 4 + cjk, int(len(text.split()) * 1.3))
+
+
+def _token_cost(text: str) -> int:
+    """What text adds to estimate_tokens() of a chunk containing it, rounded up, so the costs of
+    a chunk's units (separators included) never sum to less than the chunk's own estimate."""
+    cjk = len(_CJK_RE.findall(text))
+    return max(-(-(len(text) - cjk) // 4) + cjk, -(-len(text.split()) * 13 // 10))
+
+
+# Llama 3 uses a tiktoken BPE; cl100k_base is the closest encoding tiktoken ships.
+TOKENIZER_ENCODING = os.getenv("PRECIS_TOKENIZER_ENCODING", "cl100k_base")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """Loads the tiktoken encoder once. Returns False if tiktoken is unavailable."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception:
+                # Not installed, or its BPE file cannot be fetched offline.
+                _encoder = False
+        return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Token count from a local tokenizer, falling back to estimate_tokens without tiktoken."""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def split_paragraphs(text: str) -> list:
+    """Non-empty, stripped paragraphs of text."""
+    return [p.strip() for p in _PARAGRAPH_RE.split(text) if p.strip()]
+
+
+def split_sentences(text: str) -> list:
+    """Non-empty, stripped sentences of text (split after ., !, ? and CJK full stops)."""
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def _fits(text: str, max_tokens: int, max_bytes: int) -> bool:
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        return False
+    if max_bytes is not None and len(text.encode("utf-8")) > max_bytes:
+        return False
+    return True
+
+
+def _slice(word: str, max_tokens: int, max_bytes: int):
+    """Last resort for a run without spaces (e.g. unpunctuated CJK): cuts it by characters."""
+    piece = ""
+    for ch in word:
+        if piece and not _fits(piece + ch, max_tokens, max_bytes):
+            yield piece
+            piece = ""
+        piece += ch
+    if piece:
+        yield piece
+
+
+def _split_oversized(text: str, max_tokens: int, max_bytes: int):
+    """Splits a paragraph that does not fit into sentences, then words, then characters if it must."""
+    for sentence in _SENTENCE_RE.split(text):
+        if not sentence.strip():
+            continue
+        # Text without spaces between sentences is joined back without them.
+        sep = "" if _CJK_RE.match(sentence[-1:]) or sentence[-1:] in "。！？" else " "
+        if _fits(sentence, max_tokens, max_bytes):
+            yield sentence, sep
+            continue
+        piece = ""
+        for word in _WORD_RE.findall(sentence):
+            if not _fits(word, max_tokens, max_bytes):
+                if piece.strip():
+                    yield piece.strip(), " "
+                piece = ""
+                for part in _slice(word.strip(), max_tokens, max_bytes):
+                    yield part, ""
+                continue
+            if piece and not _fits(piece + word, max_tokens, max_bytes):
+                yield piece.strip(), " "
+                piece = ""
+            piece += word
+        if piece.strip():
+            yield piece.strip(), sep
+
+
+def _iter_units(pages, max_tokens: int, max_bytes: int):
+    """Yields (text, separator) units that each fit the budget on their own."""
+    for page in pages:
+        for paragraph in split_paragraphs(page):
+            if _fits(paragraph, max_tokens, max_bytes):
+                yield paragraph, "\n\n"
+            else:
+                yield from _split_oversized(paragraph, max_tokens, max_bytes)
+
+
+def _iter_pages(source):
+    if isinstance(source, str):
+        yield from source.split(PAGE_BREAK)
+    else:
+        for page in source:
+            yield from page.split(PAGE_BREAK)
+
+
+def iter_chunks(source, max_tokens: int = None, max_bytes: int = None, overlap_tokens: int = 0):
+    """
+    Lazily yields chunks of `source` (a string, or an iterable of page strings).
+    Pages ('\\f' in strings) and paragraphs are never merged mid-way; a chunk is emitted
+    as soon as the next unit would overflow max_tokens / max_bytes.
+    With overlap_tokens, each chunk starts with the trailing units of the previous one.
+    """
+    token_limit = max_tokens if max_tokens is not None else float("inf")
+    byte_limit = max_bytes if max_bytes is not None else float("inf")
+
+    # Each entry is (text, separator, tokens, bytes); totals are kept incrementally.
+    units, total_tokens, total_bytes = [], 0, 0
+
+    def render(parts):
+        return "".join(text + sep for text, sep, _, _ in parts).strip()
+
+    for text, sep in _iter_units(_iter_pages(source), max_tokens, max_bytes):
+        unit = (text, sep, _token_cost(text + sep), len((text + sep).encode("utf-8")))
+        if units and (total_tokens + unit[2] > token_limit or total_bytes + unit[3] > byte_limit):
+            yield render(units)
+
+            # Carry the tail of the previous chunk forward as context.
+            kept, kept_tokens, kept_bytes = [], 0, 0
+            for prev in reversed(units):
+                if kept_tokens + prev[2] > overlap_tokens:
+                    break
+                kept.insert(0, prev)
+                kept_tokens += prev[2]
+                kept_bytes += prev[3]
+            if kept_tokens + unit[2] > token_limit or kept_bytes + unit[3] > byte_limit:
+                kept, kept_tokens, kept_bytes = [], 0, 0
+            units, total_tokens, total_bytes = kept, kept_tokens, kept_bytes
+
+        units.append(unit)
+        total_tokens += unit[2]
+        total_bytes += unit[3]
+
+    if units:
+        yield render(units)
@@ -0,0 +1,206 @@
+"""
+Précis - Summary History Store
+Append-only SQLite store for generated summaries. Each summary is one insert in its own
+transaction (WAL mode), so concurrent sessions and processes never overwrite each other.
+Entry metadata and previews live apart from the full summaries, which are only read on demand.
+A full-text index (SQLite FTS5) backs history search.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+HISTORY_DB = os.getenv("PRECIS_HISTORY_DB", "summary_history.sqlite3")
+LEGACY_HISTORY_FILE = "summary_history.json"
+
+# Number of entries kept; 0 keeps everything.
+HISTORY_RETENTION = int(os.getenv("HISTORY_RETENTION", "50"))
+
+PREVIEW_CHARS = 150
+
+
+def make_preview(summary: str) -> str:
+    return (summary[:PREVIEW_CHARS] + "…") if len(summary) > PREVIEW_CHARS else summary
+
+
+class HistoryStore:
+    def __init__(self, path: str = HISTORY_DB, retention: int = HISTORY_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_name TEXT NOT NULL,
+                summary_preview TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS summaries (
+                entry_id INTEGER PRIMARY KEY REFERENCES entries (id) ON DELETE CASCADE,
+                full_summary TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.fts = self._init_search_index()
+
+    def _init_search_index(self) -> bool:
+        """Creates the FTS5 index (rowid = entry id), backfilling entries stored before it existed.
+        Returns False if this SQLite build has no FTS5; search then falls back to LIKE."""
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+            ).fetchone()
+            if exists:
+                return True
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(source_name, full_summary)"
+                )
+                self._conn.execute("""
+                    INSERT INTO history_fts (rowid, source_name, full_summary)
+                    SELECT e.id, e.source_name, s.full_summary FROM entries e JOIN summaries s ON s.entry_id = e.id
+                    WHERE e.id NOT IN (SELECT rowid FROM history_fts)
+                """)
+                self._conn.execute("COMMIT")
+                return True
+            except sqlite3.OperationalError:
+                self._conn.execute("ROLLBACK")
+                return False
+
+    def append(self, source_name: str, summary: str, timestamp: str = None) -> int:
+        """Adds one entry atomically and applies the retention limit. Returns the entry id."""
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO entries (source_name, summary_preview, timestamp) VALUES (?, ?, ?)",
+                    (source_name, make_preview(summary), timestamp),
+                )
+                entry_id = cursor.lastrowid
+                self._conn.execute(
+                    "INSERT INTO summaries (entry_id, full_summary) VALUES (?, ?)", (entry_id, summary)
+                )
+                if self.fts:
+                    self._conn.execute(
+                        "INSERT INTO history_fts (rowid, source_name, full_summary) VALUES (?, ?, ?)",
+                        (entry_id, source_name, summary),
+                    )
+                if self.retention > 0:
+                    cutoff = self._conn.execute(
+                        "SELECT id FROM entries ORDER BY id DESC LIMIT 1 OFFSET ?", (self.retention,)
+                    ).fetchone()
+                    if cutoff:
+                        self._conn.execute("DELETE FROM entries WHERE id <= ?", cutoff)
+                        if self.fts:
+                            self._conn.execute("DELETE FROM history_fts WHERE rowid <= ?", cutoff)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return entry_id
+
+    def recent(self, limit: int = 50, offset: int = 0) -> list:
+        """Newest entries first, metadata and preview only."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, source_name, summary_preview, timestamp FROM entries ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [
+            {"id": row[0], "source_name": row[1], "summary_preview": row[2], "timestamp": row[3]}
+            for row in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _match_clause(self, query: str):
+        """SQL condition and parameter selecting entries that contain every word of query (as prefixes)."""
+        words = re.findall(r"\w+", query)
+        if self.fts:
+            return "id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)", " ".join(f'"{w}"*' for w in words)
+        return ("id IN (SELECT entry_id FROM summaries WHERE full_summary LIKE ?) OR source_name LIKE ?",
+                f"%{query}%")
+
+    def search(self, query: str, limit: int = 50, offset: int = 0) -> list:
+        """Entries matching every word of query in their name or full summary, newest first."""
+        if not re.search(r"\w", query):
+            return self.recent(limit, offset)
+        clause, param = self._match_clause(query)
+        params = (param,) * clause.count("?")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, source_name, summary_preview, timestamp FROM entries WHERE {clause} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+        return [
+            {"id": row[0], "source_name": row[1], "summary_preview": row[2], "timestamp": row[3]}
+            for row in rows
+        ]
+
+    def search_count(self, query: str) -> int:
+        if not re.search(r"\w", query):
+            return self.count()
+        clause, param = self._match_clause(query)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM entries WHERE {clause}", (param,) * clause.count("?")
+            ).fetchone()[0]
+
+    def get_summary(self, entry_id: int) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT full_summary FROM summaries WHERE entry_id = ?", (entry_id,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            if self.fts:
+                self._conn.execute("DELETE FROM history_fts")
+
+    def import_legacy_json(self, path: str = LEGACY_HISTORY_FILE):
+        """One-time import of the old whole-file JSON history (newest entry first in the file)."""
+        with self._lock:
+            # Claimed in one transaction so only one process imports.
+            self._conn.execute("BEGIN IMMEDIATE")
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+            self._conn.execute("COMMIT")
+        if done or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in reversed(entries):
+            self.append(entry.get("source_name", "Unknown"), entry.get("full_summary", ""), entry.get("timestamp"))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def history_store() -> HistoryStore:
+    """Process-wide store, shared by all sessions."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+            _store.import_legacy_json()
+        return _store
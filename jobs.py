@@ -0,0 +1,462 @@
+"""
+Précis - Background Jobs
+Persistent SQLite job table plus worker processes, so extraction (uploaded files are handed
+over on disk) and summaries run outside the Streamlit script rerun. A session submits a job and polls it; the result is stored under the job id,
+so a reloaded page (or another tab) reconnects to a job already in progress.
+Workers always take the oldest queued job of the owner with the fewest running jobs, so
+one user's large batch cannot starve everyone else.
+
+Standalone workers (e.g. on another core budget than the UI): set PRECIS_JOB_WORKERS=0 for
+the app, which then only submits jobs, and run
+    python jobs.py --workers 2
+"""
+
+import argparse
+import atexit
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from chunking import PAGE_BREAK
+from metrics import Run, span
+from ocr import OCR_QUALITY, extract_documents, ocr_cache
+from pipeline import collect, spawn_context
+from summarizer import shared_limiter, summarize_text, summary_cache, summary_stats
+from translation import TRANSLATION_ERROR_MARKER, get_backend, stream_translate, translation_memory
+
+JOBS_DB = os.getenv("PRECIS_JOBS_DB", "precis_jobs.sqlite3")
+# Uploaded files of queued and running jobs, one directory per job.
+JOB_FILES_DIR = os.getenv("PRECIS_JOB_FILES_DIR", "precis_job_files")
+
+# Whether the app submits summaries as jobs; 0 runs them inside the session as before.
+USE_JOBS = os.getenv("PRECIS_USE_JOBS", "1") != "0"
+# Worker processes started by the app itself; 0 leaves the jobs to standalone workers (python jobs.py).
+JOB_WORKERS = int(os.getenv("PRECIS_JOB_WORKERS", "2"))
+
+# A running job whose worker has not checked in for this long is assumed lost and requeued.
+JOB_STALE_SECONDS = 120
+JOB_HEARTBEAT_SECONDS = 15
+JOB_MAX_ATTEMPTS = 2
+
+# Finished jobs are kept this long so a returning user can still collect the result.
+JOB_RETENTION_DAYS = 7
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                owner TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                input TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                partial TEXT,
+                result TEXT,
+                result_meta TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status_owner ON jobs (status, owner);
+        """)
+        try:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN partial TEXT")  # tables created before it existed
+        except sqlite3.OperationalError:
+            pass
+
+    def _row(self, row, columns) -> dict:
+        job = dict(zip(columns, row))
+        job["params"] = json.loads(job["params"])
+        if job.get("result_meta"):
+            job["result_meta"] = json.loads(job["result_meta"])
+        return job
+
+    def submit(self, owner: str, text: str, params: dict, files: list = None) -> str:
+        """Queues a job over text, or over files ([(name, bytes), ...]) that the worker extracts first."""
+        job_id = uuid.uuid4().hex[:16]
+        if files:
+            directory = os.path.abspath(os.path.join(JOB_FILES_DIR, job_id))
+            os.makedirs(directory, exist_ok=True)
+            saved = []
+            for index, (name, data) in enumerate(files):
+                path = os.path.join(directory, f"{index}_{os.path.basename(name)}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                saved.append({"name": name, "path": path})
+            params = dict(params, files=saved)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, owner, status, params, input, message, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, 'Waiting for a worker...', ?)",
+                (job_id, owner, json.dumps(params), text, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        """The job without its input text, or None."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, owner, status, params, progress, message, partial, result, result_meta, error, "
+                "attempts, created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+            )
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        return self._row(row, columns) if row else None
+
+    def queue_position(self, job_id: str) -> int:
+        """Queued jobs submitted before this one (0 = next in line, ignoring fairness)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND seq < (SELECT seq FROM jobs WHERE id = ?)",
+                (job_id,),
+            ).fetchone()[0]
+
+    def claim(self, worker: str) -> dict:
+        """Marks the next job running for this worker and returns it with its input, or None."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs of workers that died: retry once more, then give up.
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'error', error = 'Worker lost', finished_at = ? "
+                    "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                    (now, now - JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS),
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', message = 'Requeued after a worker was lost' "
+                    "WHERE status = 'running' AND heartbeat < ?",
+                    (now - JOB_STALE_SECONDS,),
+                )
+                # Fair share: owners with the fewest running jobs first, then oldest job.
+                cursor = self._conn.execute("""
+                    SELECT j.id, j.owner, j.status, j.params, j.input FROM jobs j
+                    WHERE j.status = 'queued' AND j.cancel_requested = 0
+                    ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.owner = j.owner AND r.status = 'running'), j.seq
+                    LIMIT 1
+                """)
+                row = cursor.fetchone()
+                columns = [c[0] for c in cursor.description]
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ?, heartbeat = ?, message = 'Starting...' WHERE id = ?",
+                        (worker, now, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row(row, columns) if row else None
+
+    def heartbeat(self, job_id: str, progress: float = None, message: str = None, partial: str = None) -> bool:
+        """Records that the job is alive (and its progress, and the part summaries streamed so far).
+        Returns True if cancellation was requested."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat = ?, progress = COALESCE(?, progress), message = COALESCE(?, message), "
+                "partial = COALESCE(?, partial) WHERE id = ?",
+                (time.time(), progress, message, partial, job_id),
+            )
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, result: str, meta: dict):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', progress = 1, message = 'Done', partial = NULL, result = ?, result_meta = ?, "
+                "finished_at = ?, input = '' WHERE id = ?",
+                (result, json.dumps(meta, ensure_ascii=False), time.time(), job_id),
+            )
+        _remove_files(job_id)
+
+    def fail(self, job_id: str, error: str, cancelled: bool = False):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, message = ?, finished_at = ?, input = '' WHERE id = ?",
+                ("cancelled" if cancelled else "error", error, error, time.time(), job_id),
+            )
+        _remove_files(job_id)
+
+    def cancel(self, job_id: str):
+        """Queued jobs are cancelled at once; running ones stop at their next progress update."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', message = 'Cancelled', finished_at = ?, input = '' "
+                "WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+        if cursor.rowcount:
+            _remove_files(job_id)
+
+    def purge(self, older_than_days: float = JOB_RETENTION_DAYS):
+        """Deletes old finished jobs, and the files of jobs that are no longer active."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+                (time.time() - older_than_days * 86400,),
+            )
+            active = {row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running')")}
+        if os.path.isdir(JOB_FILES_DIR):
+            for job_id in set(os.listdir(JOB_FILES_DIR)) - active:
+                _remove_files(job_id)
+
+
+def _remove_files(job_id: str):
+    shutil.rmtree(os.path.join(JOB_FILES_DIR, job_id), ignore_errors=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def job_store() -> JobStore:
+    """Process-wide store, shared by all sessions."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+# ---------------------------------------------------------------------------
+# Running Jobs
+# ---------------------------------------------------------------------------
+def run_job(job: dict, client, report) -> tuple:
+    """
+    Extracts the job's files (if it has any), then translates (optionally) and summarizes
+    the text. report(progress, message, partial=None) is called as work advances and may raise
+    JobCancelled; with params["stream"], partial carries the part summaries streamed so far.
+    Returns (summary, meta); meta holds the text the summary was made from (for chat
+    retrieval), the word count of the source, extraction reports, warnings and the metrics
+    spans of the run.
+    """
+    params = job["params"]
+    text = job["input"]
+    run = Run(params.get("source_name", ""))
+    warnings, translated, reports = [], [], []
+
+    files = params.get("files") or []
+    if files:
+        report(0.0, f"Extracting text from {len(files)} file(s)...")
+        contents = []
+        for file in files:
+            with open(file["path"], "rb") as f:
+                contents.append((file["name"], f.read()))
+        results = extract_documents(contents, cache=ocr_cache(), quality=params.get("ocr_quality", OCR_QUALITY))
+        for result in results:
+            if result["span"]:
+                run.add(result["span"])
+            if result["report"]:
+                reports.append(f"{result['name']}: {result['report']}")
+        text = PAGE_BREAK.join(result["text"] for result in results).strip()
+        if not text or text.startswith("[Error"):
+            raise RuntimeError(text or "No readable text found")
+
+    source = text
+    if params.get("translate"):
+        backend = get_backend(params.get("translator"))
+        # Translation runs ahead of the summarizer, which pulls translated chunks as it goes.
+        def translated_chunks():
+            with span("translate", run=run, backend=backend.name, bytes_in=len(text.encode("utf-8")),
+                      streamed=True) as stats:
+                for chunk in stream_translate(text.split(PAGE_BREAK), target_language=params.get("target_language", "en"),
+                                              source_language=params.get("source_language", "auto"),
+                                              memory=translation_memory(), stats=stats, backend=backend):
+                    stats.add("chunks")
+                    stats.add("failed_chunks", chunk == TRANSLATION_ERROR_MARKER)
+                    yield chunk
+        source = collect(translated_chunks(), translated)
+
+    report(0.0, "Summarizing...")
+    on_token = None
+    if params.get("stream"):
+        streamed = {}
+        last_partial = [0.0]
+
+        def on_token(i, delta):
+            streamed[i] = "" if delta is None else streamed.get(i, "") + delta
+            # Rendering the parts on every token would dominate; publish them about twice a second.
+            if time.monotonic() - last_partial[0] >= 0.5:
+                last_partial[0] = time.monotonic()
+                report(None, None, "".join(f"\n\n**Part {k + 1}**\n\n{streamed[k]}" for k in sorted(streamed)))
+
+    part_timings, merge_timings = [], []
+    with span("summarize", run=run, mode=params.get("mode", "sections")) as stats:
+        summary = summarize_text(
+            source, client, mode=params.get("mode", "sections"),
+            limiter=shared_limiter(), cache=summary_cache(),
+            on_progress=lambda done, total: report(0.9 * done / total, f"Summarized chunk {done}/{total}..."),
+            on_error=lambda i, e: warnings.append(f"Groq API Error on chunk {i + 1}: {e}"),
+            on_token=on_token,
+            on_level=lambda level, batches: report(0.95, f"Merging summaries (level {level}, {batches} batches)..."),
+            on_merge_error=lambda i, e: warnings.append(f"Groq API Error while merging batch {i + 1}: {e}"),
+            timings=part_timings, merge_timings=merge_timings,
+        )
+        stats.set(**summary_stats(part_timings, merge_timings))
+
+    failed = translated.count(TRANSLATION_ERROR_MARKER)
+    if failed:
+        warnings.append(f"Failed to translate {failed} chunk(s); they are marked in the text.")
+    meta = {
+        "text": "\n\n".join(translated) if params.get("translate") else text,
+        "source_words": len(text.split()),
+        "extraction": reports,
+        "warnings": warnings,
+        "spans": run.spans,
+    }
+    return summary, meta
+
+
+def worker_loop(poll_seconds: float = 1.0, stop: threading.Event = None):
+    """Claims and runs jobs until stop is set. Finished summaries are also added to the history."""
+    from groq import Groq
+    from history_store import history_store
+
+    store = JobStore()
+    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+
+    while not stop.is_set():
+        job = store.claim(worker)
+        if job is None:
+            stop.wait(poll_seconds)
+            continue
+
+        cancelled = threading.Event()
+        done = threading.Event()
+
+        def beat(job_id=job["id"]):
+            # Keeps the job alive while it waits on rate limits or a long part.
+            while not done.wait(JOB_HEARTBEAT_SECONDS):
+                if store.heartbeat(job_id):
+                    cancelled.set()
+
+        last_report = [0.0]
+
+        def report(progress, message, partial=None, job_id=job["id"]):
+            now = time.monotonic()
+            if now - last_report[0] >= 0.5:
+                last_report[0] = now
+                if store.heartbeat(job_id, progress, message, partial):
+                    cancelled.set()
+            if cancelled.is_set():
+                raise JobCancelled()
+
+        threading.Thread(target=beat, name="job-heartbeat", daemon=True).start()
+        try:
+            summary, meta = run_job(job, client, report)
+            if cancelled.is_set():
+                raise JobCancelled()
+            history_store().append(job["params"].get("source_name", "Unknown"), summary)
+            store.finish(job["id"], summary, meta)
+        except JobCancelled:
+            store.fail(job["id"], "Cancelled", cancelled=True)
+        except Exception as e:
+            store.fail(job["id"], f"{type(e).__name__}: {e}")
+        finally:
+            done.set()
+
+
+def _worker_main(stop):
+    # Also stop if the app process dies without running its exit hook.
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), stop.set()), name="job-parent-watch", daemon=True).start()
+    try:
+        worker_loop(stop=stop)
+    except KeyboardInterrupt:
+        pass
+
+
+_workers = []
+_workers_lock = threading.Lock()
+_stop = None
+
+
+def start_workers(count: int = JOB_WORKERS) -> list:
+    """Starts `count` worker processes once per server process (later calls are no-ops while they live).
+    Workers are not daemonic, so they may start process pools of their own (OCR, Argos);
+    stop_workers() runs at exit."""
+    global _stop
+    with _workers_lock:
+        _workers[:] = [p for p in _workers if p.is_alive()]
+        context = spawn_context()
+        if _stop is None:
+            _stop = context.Event()
+            atexit.register(stop_workers)
+        while len(_workers) < count:
+            process = context.Process(target=_worker_main, args=(_stop,), name=f"precis-job-worker-{len(_workers)}")
+            process.start()
+            _workers.append(process)
+        return list(_workers)
+
+
+def stop_workers(timeout: float = 10.0):
+    """Asks the workers to stop after their current job; ones still busy after `timeout` are
+    terminated (their job is requeued once its heartbeat goes stale)."""
+    with _workers_lock:
+        if _stop is None:
+            return
+        _stop.set()
+        deadline = time.monotonic() + timeout
+        for process in _workers:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        _workers.clear()
+        _stop.clear()
+
+
+def main(arg_list=None):
+    parser = argparse.ArgumentParser(description="Run Précis background job workers.")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS))
+    args = parser.parse_args(arg_list)
+    if not os.getenv("GROQ_API_KEY"):
+        print("[SYSTEM ERROR] GROQ_API_KEY environment variable is not set.")
+        return 1
+
+    job_store().purge()
+    processes = start_workers(args.workers)
+    print(f"[SYSTEM] {len(processes)} job worker(s) running on {JOBS_DB}. Ctrl+C to stop.")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
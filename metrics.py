@@ -0,0 +1,159 @@
+"""
+Précis - Metrics
+Structured spans for the processing stages (extraction, translation, summarization, chat).
+Every finished span is appended to a JSON-lines log and folded into process-wide totals,
+which can be exported in the Prometheus text format. Spans may also be grouped into a Run,
+so the UI can show where the time of one "Generate Summary" went.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# JSON-lines span log; set to "" to disable.
+METRICS_LOG = os.getenv("PRECIS_METRICS_LOG", "precis_metrics.jsonl")
+
+# If set, the Prometheus text export is rewritten here after every span (node_exporter textfile collector).
+METRICS_PROM_FILE = os.getenv("PRECIS_METRICS_PROM_FILE", "")
+
+_lock = threading.Lock()
+_totals = {}
+
+
+class Run:
+    """The spans of one user-visible operation, e.g. one summary and the chat that follows."""
+
+    def __init__(self, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def breakdown(self) -> list:
+        """One row per stage name, in first-seen order: calls, total seconds and summed numeric attributes."""
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for record in spans:
+            row = rows.setdefault(record["name"], {"stage": record["name"], "calls": 0, "seconds": 0.0})
+            row["calls"] += 1
+            row["seconds"] += record["duration"]
+            for key, value in record["attrs"].items():
+                if isinstance(value, (int, float)):
+                    row[key] = row.get(key, 0) + value
+        return list(rows.values())
+
+
+class Span:
+    """
+    Times a block and records it when the block exits:
+        with span("summarize", run=run, chars=len(text)) as s:
+            ...
+            s.set(chunks=12)
+            s.add("retries")
+    add() is thread-safe, so a span may be handed to worker threads as a counter sink.
+    """
+
+    def __init__(self, name: str, run: Run = None, **attrs):
+        self.name = name
+        self.run = run
+        self.attrs = dict(attrs)
+        self.record = None
+        self._lock = threading.Lock()
+
+    def set(self, **attrs):
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def add(self, key: str, amount=1):
+        with self._lock:
+            self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def __enter__(self):
+        self._started_at = datetime.now()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record = {
+            "name": self.name,
+            "run": self.run.id if self.run else None,
+            "start": self._started_at.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "duration": round(time.perf_counter() - self._start, 6),
+            "status": "error" if exc_type else "ok",
+            "error": str(exc) if exc else None,
+            "attrs": dict(self.attrs),
+        }
+        _record(self.record)
+        if self.run is not None:
+            self.run.add(self.record)
+        return False
+
+
+def span(name: str, run: Run = None, **attrs) -> Span:
+    return Span(name, run, **attrs)
+
+
+def _record(record: dict):
+    with _lock:
+        totals = _totals.setdefault(record["name"], {"count": 0, "seconds": 0.0, "errors": 0, "attrs": {}})
+        totals["count"] += 1
+        totals["seconds"] += record["duration"]
+        totals["errors"] += record["status"] == "error"
+        for key, value in record["attrs"].items():
+            if isinstance(value, (int, float)):
+                totals["attrs"][key] = totals["attrs"].get(key, 0) + value
+
+        # Metrics must never break the app: a read-only disk just loses the log line.
+        try:
+            if METRICS_LOG:
+                with open(METRICS_LOG, "a", encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if METRICS_PROM_FILE:
+                tmp_path = METRICS_PROM_FILE + ".tmp"
+                with open(tmp_path, "w", encoding='utf-8') as f:
+                    f.write(_prometheus_text())
+                os.replace(tmp_path, METRICS_PROM_FILE)
+        except OSError:
+            pass
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_text() -> str:
+    lines = [
+        "# HELP precis_stage_duration_seconds Time spent in each processing stage.",
+        "# TYPE precis_stage_duration_seconds summary",
+    ]
+    for name, totals in sorted(_totals.items()):
+        lines.append(f'precis_stage_duration_seconds_sum{{stage="{_label(name)}"}} {totals["seconds"]:.6f}')
+        lines.append(f'precis_stage_duration_seconds_count{{stage="{_label(name)}"}} {totals["count"]}')
+    lines += [
+        "# HELP precis_stage_errors_total Stage runs that raised.",
+        "# TYPE precis_stage_errors_total counter",
+    ]
+    for name, totals in sorted(_totals.items()):
+        lines.append(f'precis_stage_errors_total{{stage="{_label(name)}"}} {totals["errors"]}')
+    lines += [
+        "# HELP precis_stage_attribute_total Sum of a numeric span attribute (bytes, pages, chunks, tokens, retries, cache hits...).",
+        "# TYPE precis_stage_attribute_total counter",
+    ]
+    for name, totals in sorted(_totals.items()):
+        for key, value in sorted(totals["attrs"].items()):
+            lines.append(f'precis_stage_attribute_total{{stage="{_label(name)}",attribute="{_label(key)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def prometheus_text() -> str:
+    """Process-wide totals in the Prometheus text exposition format."""
+    with _lock:
+        return _prometheus_text()
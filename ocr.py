@@ -0,0 +1,818 @@
+"""
+Précis - PDF & Image Text Extraction
+Hybrid per-page extractor: reads the embedded text layer first (milliseconds per page)
+and only renders and OCRs pages that have no usable text.
+Every page reports which path produced its text.
+OCR cost is set by a quality tier (render DPI, grayscale, blank-page skipping, angle
+classification); in "auto" mode each page picks its tier from a low-resolution preview.
+Photos and scans (JPG/PNG/TIFF, one page per TIFF frame) are turned upright, scaled down to
+a bounded size and OCR'd in batches, with RapidOCR or optionally EasyOCR.
+Scanned documents are OCR'd page-parallel in a pool of worker processes, each
+holding its own warmed ONNX model. In-process OCR borrows from a process-wide pool
+of warmed engines, so models load once per server rather than once per upload.
+Extracted pages are cached on disk by PDF content hash, so re-uploads skip OCR.
+Uses PyMuPDF, Pillow and RapidOCR 3.x (its params keys, use_cls and .txts; see requirements.txt).
+"""
+
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+
+from cache import FLIGHT_STALL_SECONDS, make_key, shared_cache
+from chunking import PAGE_BREAK
+from metrics import span
+from pipeline import spawn_context
+
+# A text layer shorter than this, or mostly unreadable glyphs, is treated as missing.
+MIN_TEXT_CHARS = 20
+MIN_READABLE_RATIO = 0.6
+
+OCR_DPI = 200
+
+# Quality tiers for scanned PDF pages. Text detection time grows with the rendered pixels,
+# recognition with the number of text lines. A page is rendered at dpi, or smaller if its
+# longest side would exceed max_side pixels. balanced is the previous default; fast renders
+# about a third of its pixels and skips the angle classifier (1.5-2x the pages per second on
+# dense pages, more on sparse ones); accurate renders up to 4x the pixels for small or faint print.
+OCR_TIERS = {
+    "fast": {"dpi": 110, "max_side": 2000, "grayscale": True, "skip_blank": True, "use_cls": False},
+    "balanced": {"dpi": OCR_DPI, "max_side": 2000, "grayscale": True, "skip_blank": True, "use_cls": True},
+    "accurate": {"dpi": 300, "max_side": 4000, "grayscale": False, "skip_blank": False, "use_cls": True},
+}
+# One of OCR_TIERS, or "auto" to choose per page.
+OCR_QUALITY = os.getenv("OCR_QUALITY", "balanced")
+
+# Page previews for blank detection and "auto" are rendered at this DPI (a few ms per page).
+ANALYSIS_DPI = 36
+# A page with less ink than this (fraction of preview pixels that stand out) is blank.
+BLANK_INK_RATIO = 0.001
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(8, os.cpu_count() or 1))))
+OCR_PAGE_BATCH = int(os.getenv("OCR_PAGE_BATCH", "4"))
+OCR_ENGINE_POOL_SIZE = int(os.getenv("OCR_ENGINE_POOL_SIZE", "2"))
+OCR_CACHE_MB = int(os.getenv("OCR_CACHE_MB", "512"))
+
+# Images are scaled down to this longest side before OCR, so a 48 MP phone photo costs about
+# as much as a 200 DPI page instead of 10x more.
+OCR_MAX_IMAGE_SIDE = int(os.getenv("OCR_MAX_IMAGE_SIDE", "2000"))
+OCR_IMAGE_BATCH = int(os.getenv("OCR_IMAGE_BATCH", "8"))
+
+# "rapidocr" (default) or "easyocr" (pip install easyocr).
+OCR_IMAGE_ENGINE = os.getenv("OCR_IMAGE_ENGINE", "rapidocr")
+# EasyOCR language codes; one reader is loaded per language set.
+OCR_LANGUAGES = tuple(os.getenv("OCR_LANGUAGES", "es,en").split(","))
+
+
+def has_usable_text(text: str) -> bool:
+    """True if a page's text layer is long enough and not garbage from a broken font encoding."""
+    stripped = "".join(text.split())
+    if len(stripped) < MIN_TEXT_CHARS:
+        return False
+    readable = sum(1 for ch in stripped if ch.isprintable() and ch != "�")
+    return readable / len(stripped) >= MIN_READABLE_RATIO
+
+
+def render_page(page, dpi: int = OCR_DPI, grayscale: bool = False, max_side: int = None):
+    """Renders a PyMuPDF page to a BGR numpy array, the layout RapidOCR expects.
+    grayscale renders one channel (a third of the rasterizing and memory traffic);
+    max_side lowers the DPI so the longest side stays within that many pixels."""
+    import numpy as np
+
+    if max_side:
+        dpi = min(dpi, int(max_side * 72 / max(page.rect.width, page.rect.height)))
+    pix = page.get_pixmap(dpi=dpi, alpha=False, colorspace="gray" if grayscale else "rgb")
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+    if pix.n == 1:
+        return np.repeat(img, 3, axis=2)
+    return np.ascontiguousarray(img[:, :, ::-1])
+
+
+def ocr_image(engine, img, use_cls: bool = True) -> str:
+    """Runs RapidOCR on an image array and returns the recognized lines.
+    use_cls=False skips the text-angle classifier (fine for upright scans)."""
+    result = engine(img, use_cls=use_cls)
+    txts = getattr(result, "txts", None)
+    return "\n".join(txts) if txts else ""
+
+
+def open_pdf(pdf_bytes: bytes):
+    try:
+        import pymupdf
+    except ImportError:  # PyMuPDF < 1.24.3 only ships the fitz name
+        import fitz as pymupdf
+    return pymupdf.open(stream=pdf_bytes, filetype="pdf")
+
+
+def analyze_page(page) -> dict:
+    """
+    Cheap statistics of a low-resolution grayscale preview, measured against the page's
+    background level (its median), so tinted paper and dark themes read like white pages:
+    ink (fraction of pixels that stand out from the background), contrast (fraction of those
+    that stand out strongly; low for faint print) and noise (fraction of slightly-off pixels,
+    high for photos, stains and scanner grain).
+    """
+    import numpy as np
+
+    pix = page.get_pixmap(dpi=ANALYSIS_DPI, alpha=False, colorspace="gray")
+    img = np.frombuffer(pix.samples, dtype=np.uint8)
+    if img.size == 0:
+        return {"ink": 0.0, "contrast": 1.0, "noise": 0.0}
+    diff = np.abs(img.astype(np.int16) - int(np.median(img)))
+    ink = int(np.count_nonzero(diff > 40))
+    return {
+        "ink": ink / img.size,
+        "contrast": int(np.count_nonzero(diff > 100)) / ink if ink else 1.0,
+        "noise": int(np.count_nonzero((diff > 12) & (diff <= 40))) / img.size,
+    }
+
+
+def choose_tier(stats: dict) -> str:
+    """Quality tier for a page from analyze_page(): clean pages get fast, dense print balanced,
+    faint or noisy pages accurate."""
+    if stats["contrast"] < 0.3 or stats["noise"] > 0.25:
+        return "accurate"
+    if stats["ink"] > 0.12:
+        return "balanced"  # dense small print suffers most from a low DPI
+    return "fast"
+
+
+def ocr_pdf_page(engine, page, quality: str = OCR_QUALITY) -> tuple:
+    """OCRs one PyMuPDF page at a quality tier (or "auto"). Returns (text, tier), where tier is
+    the tier used, or "blank" for a page skipped as blank."""
+    stats = None
+    if quality == "auto" or OCR_TIERS[quality]["skip_blank"]:
+        stats = analyze_page(page)
+        if stats["ink"] < BLANK_INK_RATIO:
+            return "", "blank"
+    tier = choose_tier(stats) if quality == "auto" else quality
+    settings = OCR_TIERS[tier]
+    img = render_page(page, settings["dpi"], settings["grayscale"], settings["max_side"])
+    return ocr_image(engine, img, use_cls=settings["use_cls"]), tier
+
+
+# RapidOCR shrinks inputs to 2000 px by default; the quality tier already sized the page.
+ENGINE_DEFAULTS = {"Global.max_side_len": 4000}
+
+
+def create_ocr_engine(params: dict = None):
+    from rapidocr import RapidOCR
+
+    return RapidOCR(params={**ENGINE_DEFAULTS, **(params or {})})
+
+
+# ---------------------------------------------------------------------------
+# Warmed Engine Registry
+# ---------------------------------------------------------------------------
+class OCREnginePool:
+    """
+    Up to `size` OCR engines shared by every session in the process.
+    Engines are created lazily on first use and handed out one caller at a time,
+    since a single RapidOCR instance is not safe to call from several threads at once.
+    """
+
+    def __init__(self, size: int = OCR_ENGINE_POOL_SIZE, params: dict = None):
+        self.size = max(1, size)
+        self.params = params
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _try_create(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return create_ocr_engine(self.params)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def engine(self):
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            engine = self._try_create() or self._idle.get()
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def warm(self):
+        """Loads one engine now, if none exists yet."""
+        engine = self._try_create() if self._created == 0 else None
+        if engine is not None:
+            self._idle.put(engine)
+
+
+_engine_pools = {}
+_engine_pools_lock = threading.Lock()
+
+
+def engine_pool(params: dict = None) -> OCREnginePool:
+    """Process-wide engine pool for the given RapidOCR params."""
+    key = repr(sorted((params or {}).items()))
+    with _engine_pools_lock:
+        if key not in _engine_pools:
+            _engine_pools[key] = OCREnginePool(params=params)
+        return _engine_pools[key]
+
+
+_prewarmed = False
+
+
+def prewarm(workers: int = OCR_WORKERS, background: bool = True):
+    """Loads the in-process engine and starts the OCR worker processes ahead of the first upload.
+    Safe to call on every Streamlit rerun; only the first call does anything."""
+    global _prewarmed
+    with _engine_pools_lock:
+        if _prewarmed:
+            return
+        _prewarmed = True
+
+    def warm():
+        engine_pool().warm()
+        if workers > 1:
+            # The pool starts a process per task only while none is idle, so every worker must be
+            # kept busy until all of them have started (and loaded their models).
+            with spawn_context().Manager() as manager:
+                barrier = manager.Barrier(workers)
+                for future in [_ocr_pool(workers).submit(_wait_started, barrier) for _ in range(workers)]:
+                    future.result()
+
+    if background:
+        threading.Thread(target=warm, name="ocr-prewarm", daemon=True).start()
+    else:
+        warm()
+
+
+# ---------------------------------------------------------------------------
+# Page-Parallel OCR
+# ---------------------------------------------------------------------------
+_worker_engine = None
+
+
+def _init_worker(threads: int):
+    """Loads the OCR model once per worker process."""
+    global _worker_engine
+    # Split the cores between workers instead of letting every ONNX session claim all of them.
+    _worker_engine = create_ocr_engine({"EngineConfig.onnxruntime.intra_op_num_threads": threads})
+
+
+def _wait_started(barrier):
+    barrier.wait(timeout=300)
+
+
+def _ocr_page_range(pdf_path: str, page_indexes: list, quality: str) -> list:
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    with open_pdf(pdf_bytes) as doc:
+        return [(i, ocr_pdf_page(_worker_engine, doc[i], quality)) for i in page_indexes]
+
+
+def _ocr_frames(frames: list, max_side: int) -> list:
+    by_path = {}
+    for path, index in frames:
+        by_path.setdefault(path, []).append(index)
+    results = []
+    for path, indexes in by_path.items():
+        with open(path, "rb") as f:
+            data = f.read()
+        for index, img in zip(sorted(indexes), iter_image_frames(data, max_side, set(indexes))):
+            results.append(((path, index), ocr_image(_worker_engine, img)))
+    return results
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _ocr_pool(workers: int) -> ProcessPoolExecutor:
+    """Long-lived pool so worker models stay warm between documents (see _drop_broken_pool)."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=spawn_context(),
+                initializer=_init_worker,
+                initargs=(max(1, (os.cpu_count() or 1) // workers),),
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _drop_broken_pool():
+    """Discards the pool if a worker died (killed, out of memory) and took it down, so the next
+    _ocr_pool() call starts a new one. A broken pool refuses new work; a healthy one runs a no-op."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            return
+        try:
+            _pool.submit(int)
+        except BrokenProcessPool:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _batch_result(futures: dict, item, resubmit) -> list:
+    """The result of the batch holding item. If the pool broke, it is replaced and every batch
+    not finished yet is resubmitted once through resubmit(items) -> futures (futures is updated)."""
+    try:
+        return futures[item].result()
+    except BrokenProcessPool:
+        _drop_broken_pool()
+        lost = [key for key, future in futures.items() if not future.done() or future.exception() is not None]
+        futures.update(resubmit(lost))
+        return futures[item].result()
+
+
+def submit_ocr_pages(pdf_path: str, page_indexes: list, quality: str = OCR_QUALITY,
+                     workers: int = OCR_WORKERS, batch_size: int = OCR_PAGE_BATCH) -> dict:
+    """Queues OCR of the given 0-based pages of a PDF on disk in worker processes.
+    Returns {page_index: future}; pages of one batch share a future of [(index, (text, tier)), ...]."""
+    return _submit_batches(page_indexes, workers, batch_size, lambda batch: (_ocr_page_range, pdf_path, batch, quality))
+
+
+def submit_ocr_frames(frames: list, max_side: int = OCR_MAX_IMAGE_SIDE, workers: int = OCR_WORKERS,
+                      batch_size: int = OCR_IMAGE_BATCH) -> dict:
+    """Queues OCR of image frames, given as (image path on disk, 0-based frame index), in worker
+    processes; frames of different images share batches.
+    Returns {frame: future}; frames of one batch share a future of [(frame, text), ...]."""
+    return _submit_batches(frames, workers, batch_size, lambda batch: (_ocr_frames, batch, max_side))
+
+
+def _submit_batches(items: list, workers: int, batch_size: int, call) -> dict:
+    # call(batch) gives the function and arguments to submit for one batch of items.
+    for attempt in range(2):
+        pool = _ocr_pool(workers)
+        futures = {}
+        try:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                future = pool.submit(*call(batch))
+                futures.update((item, future) for item in batch)
+            return futures
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory) and took the pool with it; retry once on a new pool.
+            if attempt:
+                raise
+            _drop_broken_pool()
+
+
+# ---------------------------------------------------------------------------
+# Extraction Cache
+# ---------------------------------------------------------------------------
+def ocr_cache():
+    """Process-wide on-disk cache of extracted PDF pages."""
+    return shared_cache("ocr_pages", max_bytes=OCR_CACHE_MB * 1024 * 1024)
+
+
+def extraction_key(pdf_bytes: bytes, force_ocr: bool, quality: str) -> str:
+    """Cache key: SHA-256 of the PDF bytes plus everything that changes the extracted text."""
+    config = {
+        "engine": "rapidocr",
+        "quality": quality,
+        "tiers": OCR_TIERS,
+        "force_ocr": force_ocr,
+        "min_text_chars": MIN_TEXT_CHARS,
+        "min_readable_ratio": MIN_READABLE_RATIO,
+    }
+    return make_key("pdf", hashlib.sha256(pdf_bytes).hexdigest(), config)
+
+
+def iter_pdf_pages(pdf_bytes: bytes, force_ocr: bool = False, quality: str = OCR_QUALITY, engine=None,
+                   workers: int = OCR_WORKERS, batch_size: int = OCR_PAGE_BATCH, cache=None):
+    """
+    Yields every page of a PDF as soon as it is extracted, in page order:
+    {"page": 1-based number, "text": str, "method": "text" | "ocr" | "blank"};
+    OCR'd pages also carry the "quality" tier they were read at (see ocr_pdf_page).
+    Pages without usable text are OCR'd serially, or in `workers` processes
+    (`batch_size` pages per task) when there is more than one batch of them; then all batches
+    are queued up front and each page is yielded when its batch finishes.
+    With a cache, a PDF already extracted under the same settings is read from disk (those
+    pages carry "cached": True), and a completely read PDF is stored. The same PDF being
+    extracted elsewhere (another session or process) is waited for, not extracted twice.
+    """
+    if cache is not None:
+        key = extraction_key(pdf_bytes, force_ocr, quality)
+        # Pages are yielded while the key is held; a reader that stops consuming pauses the
+        # flight, and identical requests then stop waiting (after FLIGHT_STALL_SECONDS) and extract themselves.
+        with cache.flight(key, stall_seconds=FLIGHT_STALL_SECONDS) as flight:
+            if flight.value is None:
+                pages = []
+                for page in iter_pdf_pages(pdf_bytes, force_ocr, quality, engine, workers, batch_size):
+                    pages.append(page)
+                    with flight.paused():
+                        yield page
+                cache.set(key, json.dumps(pages, ensure_ascii=False))
+                return
+        for page in json.loads(flight.value):
+            yield dict(page, cached=True)
+        return
+
+    with open_pdf(pdf_bytes) as doc:
+        # The text layer is cheap to read; it decides which pages need OCR before any is rendered.
+        texts = ["" if force_ocr else page.get_text("text", sort=True) for page in doc]
+        need_ocr = [i for i, text in enumerate(texts) if not has_usable_text(text)]
+
+        temp_path, futures = None, {}
+        if workers > 1 and len(need_ocr) > batch_size:
+            # Workers read the PDF from disk instead of receiving a copy of the bytes per batch.
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+                tmp.write(pdf_bytes)
+                temp_path = tmp.name
+        try:
+            if temp_path:
+                futures = submit_ocr_pages(temp_path, need_ocr, quality, workers, batch_size)
+            done = {}
+            for i, text in enumerate(texts):
+                if i in futures:
+                    if i not in done:
+                        done.update(_batch_result(futures, i, lambda lost: submit_ocr_pages(
+                            temp_path, lost, quality, workers, batch_size)))
+                    yield _ocr_result(i, *done.pop(i))
+                elif has_usable_text(text):
+                    yield {"page": i + 1, "text": text.strip(), "method": "text"}
+                elif engine is not None:
+                    yield _ocr_result(i, *ocr_pdf_page(engine, doc[i], quality))
+                else:
+                    # No usable text layer: OCR the whole rendered page.
+                    with engine_pool().engine() as pooled:
+                        result = ocr_pdf_page(pooled, doc[i], quality)
+                    yield _ocr_result(i, *result)
+        finally:
+            if temp_path:
+                for future in set(futures.values()):
+                    future.cancel()  # reader stopped early: drop batches that have not started
+                os.remove(temp_path)
+
+
+def _ocr_result(index: int, text: str, tier: str) -> dict:
+    if tier == "blank":
+        return {"page": index + 1, "text": "", "method": "blank"}
+    return {"page": index + 1, "text": text.strip(), "method": "ocr", "quality": tier}
+
+
+def extract_pdf_pages(pdf_bytes: bytes, force_ocr: bool = False, quality: str = OCR_QUALITY, engine=None,
+                      workers: int = OCR_WORKERS, batch_size: int = OCR_PAGE_BATCH, cache=None) -> list:
+    """Extracts every page of a PDF; see iter_pdf_pages. Returns the list of page dicts."""
+    return list(iter_pdf_pages(pdf_bytes, force_ocr, quality, engine, workers, batch_size, cache))
+
+
+def join_pages(pages: list) -> str:
+    """Joins page texts with form feeds so the chunker can respect page boundaries."""
+    return PAGE_BREAK.join(p["text"] for p in pages if p["text"])
+
+
+def describe_methods(pages: list) -> str:
+    """Short report of which extraction path each page took, e.g. "12 pages: 9 text layer, 2 OCR (pages 3, 7), 1 blank".
+    Mixed OCR tiers are listed too, e.g. "(5 fast, 1 accurate)"."""
+    ocr_pages = [p["page"] for p in pages if p["method"] == "ocr"]
+    blank = sum(p["method"] == "blank" for p in pages)
+    report = f"{len(pages)} pages: {len(pages) - len(ocr_pages) - blank} text layer, {len(ocr_pages)} OCR"
+    if ocr_pages and len(ocr_pages) < len(pages):
+        report += f" (pages {', '.join(map(str, ocr_pages))})"
+    tiers = {}
+    for p in pages:
+        if p.get("quality"):
+            tiers[p["quality"]] = tiers.get(p["quality"], 0) + 1
+    if len(tiers) > 1:
+        report += " (" + ", ".join(f"{count} {tier}" for tier, count in tiers.items()) + ")"
+    if blank:
+        report += f", {blank} blank"
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Images
+# ---------------------------------------------------------------------------
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+
+
+def count_frames(data: bytes) -> int:
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as im:
+        return getattr(im, "n_frames", 1)
+
+
+def iter_image_frames(data: bytes, max_side: int = OCR_MAX_IMAGE_SIDE, indexes: set = None):
+    """
+    Yields the frames of an image file (several for a multi-page TIFF) as BGR arrays, turned
+    upright by their EXIF orientation and scaled down to at most max_side pixels.
+    indexes, if given, limits it to those 0-based frames.
+    """
+    import numpy as np
+    from PIL import Image, ImageOps, ImageSequence
+
+    with Image.open(BytesIO(data)) as im:
+        if im.format == "JPEG":
+            # Lets the JPEG decoder skip detail that the downscale would throw away anyway.
+            im.draft("RGB", (max_side, max_side))
+        for i, frame in enumerate(ImageSequence.Iterator(im)):
+            if indexes is not None and i not in indexes:
+                continue
+            frame = ImageOps.exif_transpose(frame).convert("RGB")
+            frame.thumbnail((max_side, max_side))  # only ever shrinks, keeps the aspect ratio
+            yield np.ascontiguousarray(np.asarray(frame)[:, :, ::-1])
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def easyocr_reader(languages: tuple = OCR_LANGUAGES):
+    """Process-wide EasyOCR reader per language set, with a lock for its callers.
+    Loading a reader takes seconds and hundreds of MB, so it happens once, not per image."""
+    key = tuple(sorted(languages))
+    with _readers_lock:
+        if key not in _readers:
+            import easyocr
+
+            _readers[key] = (easyocr.Reader(list(key), gpu=False), threading.Lock())
+        return _readers[key]
+
+
+def _easyocr_batch(frames: list, languages: tuple) -> list:
+    """OCRs a batch of frames; frames of the same size go through one readtext_batched call."""
+    reader, lock = easyocr_reader(languages)
+    by_shape = {}
+    for i, img in enumerate(frames):
+        by_shape.setdefault(img.shape, []).append(i)
+    texts = [""] * len(frames)
+    with lock:
+        for indexes in by_shape.values():
+            if len(indexes) == 1:
+                results = [reader.readtext(frames[indexes[0]], detail=0, paragraph=True)]
+            else:
+                results = reader.readtext_batched([frames[i] for i in indexes], detail=0, paragraph=True)
+            for i, lines in zip(indexes, results):
+                texts[i] = "\n".join(lines)
+    return texts
+
+
+def _batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def image_extraction_key(data: bytes, engine_name: str, languages: tuple, max_side: int) -> str:
+    config = {"engine": engine_name, "max_side": max_side}
+    if engine_name == "easyocr":
+        config["languages"] = sorted(languages)
+    return make_key("image", hashlib.sha256(data).hexdigest(), config)
+
+
+def iter_image_pages(data: bytes, engine_name: str = OCR_IMAGE_ENGINE, languages: tuple = OCR_LANGUAGES,
+                     max_side: int = OCR_MAX_IMAGE_SIDE, workers: int = OCR_WORKERS,
+                     batch_size: int = OCR_IMAGE_BATCH, cache=None):
+    """
+    Yields one page dict per image frame, in order, like iter_pdf_pages (method is always "ocr").
+    EasyOCR recognizes `batch_size` frames per call on a shared reader; RapidOCR spreads
+    batches over the OCR worker processes when there is more than one batch.
+    With a cache, results are stored and reused like PDF pages.
+    """
+    if cache is not None:
+        key = image_extraction_key(data, engine_name, languages, max_side)
+        # Pages are yielded while the key is held; a reader that stops consuming pauses the
+        # flight, and identical requests then stop waiting (after FLIGHT_STALL_SECONDS) and extract themselves.
+        with cache.flight(key, stall_seconds=FLIGHT_STALL_SECONDS) as flight:
+            if flight.value is None:
+                pages = []
+                for page in iter_image_pages(data, engine_name, languages, max_side, workers, batch_size):
+                    pages.append(page)
+                    with flight.paused():
+                        yield page
+                cache.set(key, json.dumps(pages, ensure_ascii=False))
+                return
+        for page in json.loads(flight.value):
+            yield dict(page, cached=True)
+        return
+
+    if engine_name == "easyocr":
+        number = 0
+        for batch in _batches(iter_image_frames(data, max_side), batch_size):
+            for text in _easyocr_batch(batch, languages):
+                number += 1
+                yield {"page": number, "text": text.strip(), "method": "ocr"}
+        return
+
+    frame_count = count_frames(data)
+    if workers > 1 and frame_count > batch_size:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".img") as tmp:
+            tmp.write(data)
+            temp_path = tmp.name
+        futures = {}
+        try:
+            futures = submit_ocr_frames([(temp_path, i) for i in range(frame_count)], max_side, workers, batch_size)
+            done = {}
+            for i in range(frame_count):
+                if (temp_path, i) not in done:
+                    done.update(_batch_result(futures, (temp_path, i), lambda lost: submit_ocr_frames(
+                        lost, max_side, workers, batch_size)))
+                yield {"page": i + 1, "text": done.pop((temp_path, i)).strip(), "method": "ocr"}
+        finally:
+            for future in set(futures.values()):
+                future.cancel()
+            os.remove(temp_path)
+        return
+
+    with engine_pool().engine() as engine:
+        for i, img in enumerate(iter_image_frames(data, max_side)):
+            yield {"page": i + 1, "text": ocr_image(engine, img).strip(), "method": "ocr"}
+
+
+def extract_images(images: list, engine_name: str = OCR_IMAGE_ENGINE, languages: tuple = OCR_LANGUAGES,
+                   max_side: int = OCR_MAX_IMAGE_SIDE, workers: int = OCR_WORKERS,
+                   batch_size: int = OCR_IMAGE_BATCH, cache=None) -> list:
+    """
+    Page dicts of several image files (one list per file, as iter_image_pages yields them),
+    OCR'd together: the frames of all of them share EasyOCR calls or OCR worker tasks, so a
+    set of phone photos is not read one image at a time.
+    With a cache, every image is cached and single-flighted under its own key.
+    """
+    if cache is None:
+        return [[{"page": i + 1, "text": text, "method": "ocr"} for i, text in enumerate(texts)]
+                for texts in _ocr_image_set(images, engine_name, languages, max_side, workers, batch_size)]
+
+    keys = [image_extraction_key(data, engine_name, languages, max_side) for data in images]
+    data_by_key = dict(zip(keys, images))
+    with ExitStack() as stack:
+        # Claimed in sorted order, so sessions with overlapping sets of images cannot deadlock.
+        flights = {key: stack.enter_context(cache.flight(key, stall_seconds=FLIGHT_STALL_SECONDS))
+                   for key in sorted(data_by_key)}
+        todo = [key for key, flight in flights.items() if flight.value is None]
+        pages = {key: [dict(page, cached=True) for page in json.loads(flight.value)]
+                 for key, flight in flights.items() if flight.value is not None}
+        texts = _ocr_image_set([data_by_key[key] for key in todo], engine_name, languages, max_side, workers, batch_size)
+        for key, frame_texts in zip(todo, texts):
+            pages[key] = [{"page": i + 1, "text": text, "method": "ocr"} for i, text in enumerate(frame_texts)]
+            cache.set(key, json.dumps(pages[key], ensure_ascii=False))
+    return [pages[key] for key in keys]
+
+
+def _ocr_image_set(images: list, engine_name: str, languages: tuple, max_side: int, workers: int,
+                   batch_size: int) -> list:
+    # Frame texts of every image, one list per image.
+    texts = [[] for _ in images]
+    if not images:
+        return texts
+    if engine_name == "easyocr":
+        frames = ((n, img) for n, data in enumerate(images) for img in iter_image_frames(data, max_side))
+        for batch in _batches(frames, batch_size):
+            for (n, _), text in zip(batch, _easyocr_batch([img for _, img in batch], languages)):
+                texts[n].append(text.strip())
+        return texts
+
+    counts = [count_frames(data) for data in images]
+    total = sum(counts)
+    if workers > 1 and total > 1:
+        paths, futures = [], {}
+        try:
+            for data in images:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".img") as tmp:
+                    tmp.write(data)
+                paths.append(tmp.name)
+            frames = [(path, i) for path, count in zip(paths, counts) for i in range(count)]
+            # Small sets are spread over all workers instead of filling one batch.
+            size = max(1, min(batch_size, -(-total // workers)))
+            futures = submit_ocr_frames(frames, max_side, workers, size)
+            done = {}
+            for frame in frames:
+                if frame not in done:
+                    done.update(_batch_result(futures, frame, lambda lost: submit_ocr_frames(
+                        lost, max_side, workers, size)))
+            return [[done[(path, i)].strip() for i in range(count)] for path, count in zip(paths, counts)]
+        finally:
+            for future in set(futures.values()):
+                future.cancel()
+            for path in paths:
+                os.remove(path)
+
+    with engine_pool().engine() as engine:
+        for n, data in enumerate(images):
+            texts[n] = [ocr_image(engine, img).strip() for img in iter_image_frames(data, max_side)]
+    return texts
+
+
+# ---------------------------------------------------------------------------
+# Documents
+# ---------------------------------------------------------------------------
+SUPPORTED_EXTENSIONS = (".txt", ".pdf") + IMAGE_EXTENSIONS
+
+
+def extract_pdf_text(pdf_bytes: bytes, cache=None, stats=None, quality: str = OCR_QUALITY) -> tuple:
+    """Returns (text, per-page method report). Errors are reported in the text, as the app shows them.
+    stats, if given (e.g. a metrics span), receives pages, ocr_pages and cache_hit."""
+    try:
+        pages = extract_pdf_pages(pdf_bytes, quality=quality, cache=cache)
+        if stats is not None:
+            stats.set(pages=len(pages), ocr_pages=sum(p["method"] == "ocr" for p in pages),
+                      blank_pages=sum(p["method"] == "blank" for p in pages),
+                      cache_hit=bool(pages) and pages[0].get("cached", False))
+        text = join_pages(pages)
+        return (text if text.strip() else "[No readable text found in PDF]"), describe_methods(pages)
+    except Exception as e:
+        return f"[Error extracting PDF text: {str(e)}]", None
+
+
+def extract_image_text(data: bytes, cache=None, stats=None) -> tuple:
+    """Image counterpart of extract_pdf_text."""
+    try:
+        pages = list(iter_image_pages(data, cache=cache))
+        if stats is not None:
+            stats.set(pages=len(pages), ocr_pages=len(pages),
+                      cache_hit=bool(pages) and pages[0].get("cached", False))
+        return _image_text(pages)
+    except Exception as e:
+        return f"[Error extracting image text: {str(e)}]", None
+
+
+def _image_text(pages: list) -> tuple:
+    text = join_pages(pages)
+    report = f"{len(pages)} image page(s), OCR" if len(pages) > 1 else None
+    return (text if text.strip() else "[No readable text found in image]"), report
+
+
+def extract_document(name: str, data: bytes, cache=None, quality: str = OCR_QUALITY) -> dict:
+    """Extracts one file by extension. Makes no Streamlit calls, so it can run on any thread.
+    The result's "span" is the metrics record of the extraction."""
+    lower = (name or "").lower()
+    text, report = "[Unsupported file type.]", None
+    with span("extract", file=name, bytes=len(data)) as s:
+        if lower.endswith(".txt"):
+            text = data.decode("utf-8", errors="replace")
+        elif lower.endswith(".pdf"):
+            text, report = extract_pdf_text(data, cache, stats=s, quality=quality)
+        elif lower.endswith(IMAGE_EXTENSIONS):
+            text, report = extract_image_text(data, cache, stats=s)
+        s.set(chars=len(text), failed=text.startswith("[Error") or text.startswith("[Unsupported"))
+    return {"name": name, "text": text, "report": report, "span": s.record}
+
+
+def extract_documents(files: list, cache=None, quality: str = OCR_QUALITY, workers: int = 4) -> list:
+    """
+    extract_document for several (name, data) files, results in file order. PDFs and text
+    files are extracted on up to `workers` threads meanwhile; images are OCR'd together
+    (see extract_images) under one span, which is recorded on the first image's result.
+    """
+    results = [None] * len(files)
+    images = [i for i, (name, _) in enumerate(files) if (name or "").lower().endswith(IMAGE_EXTENSIONS)]
+    others = [i for i in range(len(files)) if i not in set(images)]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(others), workers))) as pool:
+        futures = {i: pool.submit(extract_document, *files[i], cache=cache, quality=quality) for i in others}
+        if images:
+            for i, result in zip(images, _extract_image_group([files[i] for i in images], cache)):
+                results[i] = result
+        for i, future in futures.items():
+            results[i] = future.result()
+    return results
+
+
+def _extract_image_group(files: list, cache) -> list:
+    names = [name for name, _ in files]
+    with span("extract", file=", ".join(names), bytes=sum(len(data) for _, data in files), images=len(files)) as s:
+        try:
+            page_lists = extract_images([data for _, data in files], cache=cache)
+            texts = [_image_text(pages) for pages in page_lists]
+            s.set(pages=sum(map(len, page_lists)), ocr_pages=sum(map(len, page_lists)),
+                  cache_hit=all(pages and pages[0].get("cached", False) for pages in page_lists))
+        except Exception as e:
+            texts = [(f"[Error extracting image text: {str(e)}]", None)] * len(files)
+        s.set(chars=sum(len(text) for text, _ in texts), failed=any(text.startswith("[Error") for text, _ in texts))
+    return [{"name": name, "text": text, "report": report, "span": s.record if i == 0 else None}
+            for i, (name, (text, report)) in enumerate(zip(names, texts))]
+
+
+def iter_document_pages(name: str, data: bytes, cache=None, quality: str = OCR_QUALITY):
+    """Streaming counterpart of extract_document: yields page dicts as they are extracted.
+    A text file is a single page. Errors are raised, not reported in the text."""
+    lower = (name or "").lower()
+    if lower.endswith(".txt"):
+        yield {"page": 1, "text": data.decode("utf-8", errors="replace"), "method": "text"}
+    elif lower.endswith(".pdf"):
+        yield from iter_pdf_pages(data, quality=quality, cache=cache)
+    elif lower.endswith(IMAGE_EXTENSIONS):
+        yield from iter_image_pages(data, cache=cache)
+    else:
+        raise ValueError(f"Unsupported file type: {name}")
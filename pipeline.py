@@ -0,0 +1,181 @@
+"""
+Précis - Stage Pipeline
+Minimal thread-and-queue pipeline: each stage runs a function on its own worker threads
+and passes results downstream through a bounded queue, so a slow stage applies
+backpressure instead of letting work pile up in memory.
+The generator helpers at the bottom stream a single document the same way: pages flow
+from extraction through translation into the chunker while earlier chunks are summarized,
+each step running at most a few items ahead of the next.
+Worker processes (OCR and Argos pools, background job workers) all start from spawn_context().
+"""
+
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+END = object()
+
+
+class _Raised:
+    """Carries a producer's exception through a queue to the consumer."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class StageError(Exception):
+    """A failure in an upstream streaming stage, labelled with the stage name."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def start_stage(fn, inbox: queue.Queue, workers: int = 1, maxsize: int = 4, name: str = "stage") -> queue.Queue:
+    """
+    Starts `workers` threads that put fn(item) on the returned queue for every item taken
+    from inbox, until END. END is forwarded downstream once the last worker finishes.
+    Result order is not preserved across workers.
+    """
+    workers = max(1, workers)
+    outbox = queue.Queue(maxsize=maxsize)
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                item = inbox.get()
+                if item is END:
+                    inbox.put(END)  # let sibling workers see it too
+                    break
+                outbox.put(fn(item))
+        finally:
+            # fn is expected to handle its own errors; if it raises anyway, the stream still ends.
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                outbox.put(END)
+
+    for n in range(workers):
+        threading.Thread(target=worker, name=f"{name}-{n}", daemon=True).start()
+    return outbox
+
+
+def feed(items, maxsize: int = 4) -> queue.Queue:
+    """Queue fed from an iterable on a background thread, followed by END."""
+    inbox = queue.Queue(maxsize=maxsize)
+
+    def producer():
+        try:
+            for item in items:
+                inbox.put(item)
+        except Exception as e:
+            inbox.put(_Raised(e))  # re-raised by drain, so a failed producer never looks like a short stream
+        finally:
+            inbox.put(END)
+
+    threading.Thread(target=producer, name="feed", daemon=True).start()
+    return inbox
+
+
+def drain(outbox: queue.Queue):
+    """Yields items from a stage's output queue until END."""
+    while True:
+        item = outbox.get()
+        if item is END:
+            return
+        if isinstance(item, _Raised):
+            raise item.error
+        yield item
+
+
+# ---------------------------------------------------------------------------
+# Streaming Helpers
+# ---------------------------------------------------------------------------
+def prefetch(items, maxsize: int = 4):
+    """
+    Starts iterating items on a background thread, at most maxsize items ahead of the
+    consumer, and returns a generator over them. Producer errors are re-raised in order.
+    If the consumer stops early, the producer stops too and closes items.
+    """
+    inbox = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                inbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except Exception as e:
+            put(_Raised(e))
+        finally:
+            if stopped.is_set() and hasattr(items, "close"):
+                items.close()  # runs upstream cleanup (temp files, worker batches)
+            put(END)
+
+    threading.Thread(target=producer, name="prefetch", daemon=True).start()
+
+    def consume():
+        try:
+            yield from drain(inbox)
+        finally:
+            stopped.set()
+
+    return consume()
+
+
+def ordered_map(fn, items, workers: int = 2, lookahead: int = None):
+    """Yields fn(item) for every item, in input order, computed on `workers` threads.
+    At most `lookahead` items are in flight, so a slow consumer stops the reading of items."""
+    lookahead = lookahead or workers * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= lookahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def labelled(items, stage: str):
+    """Re-raises errors from an iterable as StageError(stage, ...)."""
+    try:
+        yield from items
+    except StageError:
+        raise
+    except Exception as e:
+        raise StageError(stage, e) from e
+
+
+def collect(items, sink: list):
+    """Passes items through unchanged, appending each one to sink."""
+    for item in items:
+        sink.append(item)
+        yield item
+
+
+# ---------------------------------------------------------------------------
+# Worker Processes
+# ---------------------------------------------------------------------------
+def spawn_context():
+    """
+    Multiprocessing context for every worker process the app starts. Spawn, not fork:
+    the parent runs Streamlit threads and may hold loaded models (ONNX, Argos), which a
+    forked child would inherit in whatever state the other threads left their locks.
+    """
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,78 @@
+"""
+Précis - Local Retrieval
+BM25 index over passages of the source document, built at summary time.
+Chat questions retrieve the top-k passages so answers can cite details the summary
+dropped. Pure Python, runs offline on CPU.
+"""
+
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from chunking import iter_chunks
+
+PASSAGE_TOKENS = int(os.getenv("RETRIEVAL_PASSAGE_TOKENS", "250"))
+PASSAGE_OVERLAP_TOKENS = 40
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Only the most frequent English function words; everything else is kept.
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were what
+when where which who why with how do does did can could would should will not no
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of passages, with an inverted index for sparse scoring."""
+
+    def __init__(self, passages: list, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, passage in enumerate(passages):
+            terms = tokenize(passage)
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((i, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(passages)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> list:
+        """Returns up to k (score, passage) pairs, best first. Only passages sharing a term are scored."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.passages[i]) for i, score in best]
+
+    def __len__(self):
+        return len(self.passages)
+
+
+def build_index(text: str, passage_tokens: int = PASSAGE_TOKENS) -> BM25Index:
+    """Splits text into small overlapping passages and indexes them."""
+    passages = list(iter_chunks(text, max_tokens=passage_tokens, overlap_tokens=PASSAGE_OVERLAP_TOKENS))
+    return BM25Index(passages)
+
+
+def format_passages(results: list) -> str:
+    """Renders retrieved passages for the prompt, in retrieval order."""
+    return "\n\n".join(f"[Excerpt {n}]\n{passage}" for n, (_, passage) in enumerate(results, start=1))
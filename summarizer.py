@@ -0,0 +1,486 @@
+"""
+Précis - Summarization Engine
+Sends text chunks to Groq (Llama 3.3) with bounded concurrency.
+Requests are paced by a token-bucket rate limiter instead of fixed sleeps (shared through
+SQLite by every process on the machine: the app, job workers and batch runs),
+and 429 / 5xx responses are retried with jittered exponential backoff.
+Completions can be streamed token by token, with time-to-first-token recorded.
+Contains no Streamlit calls so it can run headless.
+"""
+
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache import CACHE_DIR, make_key, shared_cache
+from chunking import SUMMARY_CHUNK_TOKENS, estimate_tokens, iter_chunks
+
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+SYSTEM_PROMPT = """
+    You are an expert content synthesizer. Summarize the provided text.
+    Focus on factual accuracy and eliminate fluff.
+    Be technical and precise
+    Style: Use concise paragraphs. Use ASCII art or bullet points to structure.
+    Do NOT be redundant.
+    """
+
+# Groq free-tier quota for llama-3.3-70b-versatile, override per API key.
+REQUESTS_PER_MIN = int(os.getenv("GROQ_REQUESTS_PER_MIN", "30"))
+TOKENS_PER_MIN = int(os.getenv("GROQ_TOKENS_PER_MIN", "12000"))
+MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+
+# Budget reserved for the completion when charging the tokens/min bucket.
+EXPECTED_OUTPUT_TOKENS = 1024
+
+
+# ---------------------------------------------------------------------------
+# Rate Limiting
+# ---------------------------------------------------------------------------
+class TokenBucket:
+    """Continuously refilled bucket. Reservations may go negative (debt),
+    which makes later callers wait their turn in arrival order."""
+
+    def __init__(self, rate_per_min: float, capacity: float = None):
+        self.rate_per_sec = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+    def reserve(self, amount: float, now: float = None) -> float:
+        """Takes `amount` from the bucket and returns how long to wait before using it."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_sec)
+        self.last_refill = now
+
+        # A single request bigger than the bucket waits for a full bucket, not forever.
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate_per_sec
+
+
+class RateLimiter:
+    """Paces API calls by requests/min and tokens/min. Safe to share across threads."""
+
+    def __init__(self, requests_per_min: int = REQUESTS_PER_MIN, tokens_per_min: int = TOKENS_PER_MIN):
+        self._lock = threading.Lock()
+        self.request_bucket = TokenBucket(requests_per_min)
+        self.token_bucket = TokenBucket(tokens_per_min)
+
+    def acquire(self, tokens: int) -> float:
+        """Blocks until one request of `tokens` tokens may be sent. Returns the time waited."""
+        with self._lock:
+            wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose bucket levels live in a SQLite file, so all processes using the file
+    draw on one quota. Each reservation is one short write transaction.
+    """
+
+    def __init__(self, path: str, requests_per_min: int = REQUESTS_PER_MIN, tokens_per_min: int = TOKENS_PER_MIN):
+        super().__init__(requests_per_min, tokens_per_min)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def acquire(self, tokens: int) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                wait = max(self._reserve("requests", self.request_bucket, 1, now),
+                           self._reserve("tokens", self.token_bucket, tokens, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _reserve(self, name: str, bucket: TokenBucket, amount: float, now: float) -> float:
+        row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        bucket.tokens, bucket.last_refill = row if row else (bucket.capacity, now)
+        wait = bucket.reserve(amount, now)
+        self._conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                           (name, bucket.tokens, bucket.last_refill))
+        return wait
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def shared_limiter() -> RateLimiter:
+    """Machine-wide limiter, since the Groq quota belongs to the API key and not the session
+    or the process: the app and its job workers all pace themselves against one bucket."""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = SharedRateLimiter(os.path.join(CACHE_DIR, "rate_limits.sqlite"))
+        return _shared_limiter
+
+
+# ---------------------------------------------------------------------------
+# Retry Handling
+# ---------------------------------------------------------------------------
+def _is_retryable(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts carry no status code.
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(exc: Exception):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retry(fn, max_retries: int = 5, retryable=_is_retryable, on_retry=None):
+    """Calls fn(), retrying errors accepted by `retryable` (rate-limit, server and connection errors by default).
+    on_retry(exc, delay) is called before each retry."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not retryable(e):
+                raise
+            delay = _retry_after(e)
+            delay = delay if delay is not None else backoff_delay(attempt)
+            if on_retry:
+                on_retry(e, delay)
+            time.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# Chunk Summarization
+# ---------------------------------------------------------------------------
+SUMMARY_CACHE_MB = int(os.getenv("SUMMARY_CACHE_MB", "256"))
+
+
+def summary_cache():
+    """Process-wide on-disk cache of chunk summaries."""
+    return shared_cache("summaries", max_bytes=SUMMARY_CACHE_MB * 1024 * 1024)
+
+
+def iter_deltas(stream):
+    """Yields the non-empty text pieces of a streamed chat completion."""
+    for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            yield event.choices[0].delta.content
+
+
+def complete_chat(client, messages: list, on_delta=None) -> dict:
+    """
+    Runs one chat completion. With on_delta, the Groq streaming API is used and
+    on_delta(text) is called for every piece as it arrives.
+    Returns {"text", "ttft", "latency"} with times in seconds from sending the request.
+    """
+    start = time.perf_counter()
+    if on_delta is None:
+        completion = client.chat.completions.create(model=MODEL_NAME, messages=messages)
+        latency = time.perf_counter() - start
+        return {"text": completion.choices[0].message.content, "ttft": latency, "latency": latency}
+
+    ttft, parts = None, []
+    for delta in iter_deltas(client.chat.completions.create(model=MODEL_NAME, messages=messages, stream=True)):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        parts.append(delta)
+        on_delta(delta)
+    latency = time.perf_counter() - start
+    return {"text": "".join(parts), "ttft": ttft if ttft is not None else latency, "latency": latency}
+
+
+def summarize_chunk(chunk: str, client, limiter: RateLimiter = None,
+                    system_prompt: str = SYSTEM_PROMPT, max_retries: int = 5, cache=None,
+                    on_delta=None, timing: dict = None) -> str:
+    """Summarizes one chunk, waiting on the limiter before every attempt.
+    With a cache, identical (chunk, prompt, model) requests are answered from disk, and a
+    request identical to one in flight (in any session or worker process) waits for its result.
+    on_delta streams the output; on_delta(None) means a retry discarded what was streamed so far.
+    timing, if given, receives the ttft / latency of the successful attempt, the retries,
+    the seconds spent waiting on the limiter and retry backoff, and estimated tokens in and out."""
+    if cache is None:
+        return _request_summary(chunk, client, limiter, system_prompt, max_retries, on_delta, timing)
+
+    key = make_key(MODEL_NAME, system_prompt, chunk, {})
+    start = time.perf_counter()
+    with cache.flight(key) as flight:
+        if flight.value is None:
+            text = _request_summary(chunk, client, limiter, system_prompt, max_retries, on_delta, timing)
+            cache.set(key, text)
+            return text
+        cached = flight.value
+    if on_delta:
+        on_delta(cached)
+    if timing is not None:
+        # wait is the time spent on an identical request that was already running.
+        timing.update(ttft=0.0, latency=0.0, cached=True, retries=0, wait=round(time.perf_counter() - start, 3),
+                      tokens_in=0, tokens_out=0)
+    return cached
+
+
+def _request_summary(chunk: str, client, limiter, system_prompt: str, max_retries: int, on_delta, timing) -> str:
+    limiter = limiter or shared_limiter()
+    tokens = estimate_tokens(system_prompt) + estimate_tokens(chunk) + EXPECTED_OUTPUT_TOKENS
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": chunk}
+    ]
+
+    waits = {"retries": 0, "wait": 0.0}
+
+    def request():
+        waits["wait"] += limiter.acquire(tokens)
+        if on_delta:
+            on_delta(None)
+        return complete_chat(client, messages, on_delta)
+
+    def on_retry(e, delay):
+        waits["retries"] += 1
+        waits["wait"] += delay
+
+    result = call_with_retry(request, max_retries=max_retries, on_retry=on_retry)
+    if timing is not None:
+        timing.update(ttft=result["ttft"], latency=result["latency"], cached=False,
+                      tokens_in=tokens - EXPECTED_OUTPUT_TOKENS, tokens_out=estimate_tokens(result["text"]), **waits)
+    return result["text"]
+
+
+def summarize_chunks(chunks, client, limiter: RateLimiter = None, max_workers: int = MAX_CONCURRENCY,
+                     system_prompt: str = SYSTEM_PROMPT, max_retries: int = 5, cache=None,
+                     on_progress=None, on_error=None, on_token=None, timings: list = None) -> list:
+    """
+    Summarizes chunks concurrently and returns the summaries in part order.
+    Parts that still fail after retrying are None and reported through on_error(index, exc).
+    With on_token, outputs are streamed: on_token(index, delta) for each piece, and
+    on_token(index, None) when a retry restarts a part.
+    timings, if given, is filled with one timing dict per part (see summarize_chunk).
+    Callbacks run on the calling thread, so they may safely touch Streamlit elements.
+    An exception raised while reading chunks is re-raised once the parts already submitted finish.
+    """
+    # Worker threads push streamed pieces here; the calling thread hands them to on_token.
+    deltas = queue.SimpleQueue() if on_token else None
+
+    def drain():
+        while True:
+            try:
+                i, delta = deltas.get_nowait()
+            except queue.Empty:
+                return
+            on_token(i, delta)
+
+    workers = max(1, max_workers)
+    # chunks may be a lazy generator fed by extraction and translation. It is read on a
+    # separate thread so this thread keeps reporting progress while the next chunk is cut,
+    # and at most `in_flight` parts are queued ahead of the API calls (backpressure upstream).
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    submitted = queue.SimpleQueue()
+    part_timings = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submitter():
+            try:
+                for i, chunk in enumerate(chunks):
+                    in_flight.acquire()
+                    on_delta = (lambda delta, i=i: deltas.put((i, delta))) if deltas else None
+                    part_timings.append({})
+                    future = pool.submit(summarize_chunk, chunk, client, limiter, system_prompt, max_retries,
+                                         cache, on_delta, part_timings[i])
+                    future.add_done_callback(lambda _: in_flight.release())
+                    submitted.put((i, future))
+            except Exception as e:
+                submitted.put(e)
+                if hasattr(chunks, "close"):
+                    chunks.close()  # stop upstream producers (extraction, translation) too
+            finally:
+                submitted.put(None)
+
+        threading.Thread(target=submitter, name="summarize-submit", daemon=True).start()
+
+        futures, results, done = {}, [], 0
+        pending, reading, upstream_error = set(), True, None
+        while reading or pending:
+            while reading:
+                try:
+                    entry = submitted.get(timeout=0.1) if not pending else submitted.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    reading = False
+                elif isinstance(entry, Exception):
+                    upstream_error = entry
+                else:
+                    futures[entry[1]] = entry[0]
+                    pending.add(entry[1])
+                    results.append(None)
+            if pending:
+                timeout = 0.1 if (deltas or reading) else None
+                finished, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                finished = ()
+            if deltas:
+                drain()
+            for future in finished:
+                i = futures[future]
+                done += 1
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    if on_error:
+                        on_error(i, e)
+                if on_progress:
+                    # The total grows while chunks are still arriving.
+                    on_progress(done, len(futures))
+
+    if upstream_error is not None:
+        raise upstream_error
+    if timings is not None:
+        timings.extend(part_timings)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Hierarchical (Tree) Reduction
+# ---------------------------------------------------------------------------
+REDUCE_PROMPT = """
+    You are an expert content synthesizer. You are given consecutive partial summaries of one document.
+    Merge them into a single summary that keeps every key fact, number and conclusion, in document order.
+    Be technical and precise. Remove repetition between the parts.
+    Style: Use concise paragraphs. Use ASCII art or bullet points to structure.
+    Keep the result under {max_words} words.
+    """
+
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1500"))
+
+# Upper bound on the merged input sent in one reduce request.
+REDUCE_INPUT_TOKENS = 8000
+
+
+def _batch_by_tokens(texts: list, batch_size: int, max_tokens: int) -> list:
+    """Groups consecutive texts into batches of at most batch_size items and max_tokens tokens."""
+    batches, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def reduce_summaries(summaries: list, client, limiter: RateLimiter = None,
+                     target_tokens: int = SUMMARY_TOKEN_BUDGET, batch_size: int = 4,
+                     max_workers: int = MAX_CONCURRENCY, max_levels: int = 6, cache=None,
+                     on_level=None, on_error=None, timings: list = None) -> str:
+    """
+    Tree-reduces chunk summaries: each level merges batches of neighbouring summaries
+    in parallel, until a single summary fits target_tokens (or max_levels is reached).
+    on_level(level, batch_count) is called before each level is sent.
+    timings, if given, receives one timing dict per merge request.
+    """
+    level = [s for s in summaries if s]
+    if not level:
+        return ""
+
+    prompt = REDUCE_PROMPT.format(max_words=int(target_tokens * 0.75))
+    for depth in range(1, max_levels + 1):
+        if len(level) == 1 and estimate_tokens(level[0]) <= target_tokens:
+            break
+
+        batches = _batch_by_tokens(level, batch_size, REDUCE_INPUT_TOKENS)
+        if on_level:
+            on_level(depth, len(batches))
+
+        merged_inputs = ["\n\n".join(batch) for batch in batches]
+        merged = summarize_chunks(
+            merged_inputs, client, limiter=limiter, max_workers=max_workers,
+            system_prompt=prompt, cache=cache, on_error=on_error, timings=timings,
+        )
+        # A failed merge keeps its inputs so no part of the document is lost.
+        level = [m if m is not None else text for m, text in zip(merged, merged_inputs)]
+
+    return "\n\n".join(level)
+
+
+# ---------------------------------------------------------------------------
+# Documents
+# ---------------------------------------------------------------------------
+def summary_stats(timings: list, merge_timings: list = ()) -> dict:
+    """Totals over the timing dicts of one summarize_text run, for metrics spans."""
+    requests = list(timings) + list(merge_timings)
+    return {
+        "chunks": len(timings),
+        "merges": len(merge_timings),
+        "cache_hits": sum(t.get("cached", False) for t in requests),
+        "retries": sum(t.get("retries", 0) for t in requests),
+        "wait": round(sum(t.get("wait", 0.0) for t in requests), 3),
+        "tokens_in": sum(t.get("tokens_in", 0) for t in requests),
+        "tokens_out": sum(t.get("tokens_out", 0) for t in requests),
+        "failed_chunks": sum(not t for t in timings),
+    }
+
+
+def format_sections(chunk_summaries: list) -> str:
+    """One "--- Summary of Part N ---" section per part; failed parts are left out."""
+    return "".join(
+        f"\n\n--- Summary of Part {i + 1} ---\n" + chunk_summary
+        for i, chunk_summary in enumerate(chunk_summaries) if chunk_summary is not None
+    )
+
+
+def summarize_text(text, client, mode: str = "sections", limiter: RateLimiter = None, cache=None,
+                   on_progress=None, on_error=None, on_token=None, on_level=None, on_merge_error=None,
+                   timings: list = None, merge_timings: list = None) -> str:
+    """
+    Chunks and summarizes a whole document. mode="tree" reduces the part summaries to one
+    budget-sized summary; "sections" keeps one section per part.
+    text may also be an iterable of pages (e.g. from pipeline.stream_translate); parts are
+    summarized as soon as the chunker fills them, while later pages are still arriving.
+    Callbacks are passed through to summarize_chunks / reduce_summaries, and so are
+    timings (per part) and merge_timings (per merge request).
+    """
+    chunk_summaries = summarize_chunks(
+        iter_chunks(text, max_tokens=SUMMARY_CHUNK_TOKENS), client,
+        limiter=limiter, cache=cache,
+        on_progress=on_progress, on_error=on_error, on_token=on_token, timings=timings,
+    )
+    if mode == "tree":
+        return reduce_summaries(
+            chunk_summaries, client, limiter=limiter, cache=cache,
+            on_level=on_level, on_error=on_merge_error, timings=merge_timings,
+        )
+    return format_sections(chunk_summaries)
@@ -6,21 +6,28 @@ Integrated with Groq (Llama 3.3), Google Translator, RapidOCR, and Chat Memory.
 
 import streamlit as st
 import time
-from datetime import datetime
 from io import BytesIO
 import re
 import math
 import json
 import os
-import textwrap
-import tempfile
-from collections import deque
+import hashlib
+import uuid
 
 # --- Backend Dependencies ---
-from deep_translator import GoogleTranslator
-from rapidocr_pdf import RapidOCRPDF
 from groq import Groq
 
+from chunking import PAGE_BREAK
+from summarizer import summarize_text, shared_limiter, summary_cache, summary_stats
+from chat_context import FastContextManager
+from retrieval import build_index
+from history_store import history_store
+from translation import BACKENDS, SOURCE_LANGUAGES, TRANSLATE_BACKEND, TRANSLATION_ERROR_MARKER, TranslationFailed, get_backend, stream_translate, translation_memory
+from pipeline import collect
+from metrics import Run, prometheus_text, span
+from ocr import IMAGE_EXTENSIONS, OCR_QUALITY, OCR_TIERS, SUPPORTED_EXTENSIONS, extract_documents, ocr_cache, prewarm as prewarm_ocr
+from jobs import JOB_WORKERS, USE_JOBS, job_store, start_workers
+
 # ---------------------------------------------------------------------------
 # App Configuration & CSS
 # ---------------------------------------------------------------------------
@@ -230,6 +237,7 @@ st.markdown("""
     
     .file-card-icon.pdf { background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%); }
     .file-card-icon.txt { background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); }
+    .file-card-icon.img { background: linear-gradient(135deg, #10b981 0%, #059669 100%); }
     
     .file-card-name { font-weight: 600; color: #1e293b; flex: 1; }
     .file-card-size { color: #64748b; font-size: 0.85rem; }
@@ -263,164 +271,143 @@ st.markdown("""
 # ---------------------------------------------------------------------------
 # Backend Logic & State Management
 # ---------------------------------------------------------------------------
-HISTORY_FILE = "summary_history.json"
-
-class FastContextManager:
-    def __init__(self, max_words=8000):
-        self.messages = deque()
-        self.current_word_count = 0
-        self.max_words = max_words
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-    def _count_words(self, text: str) -> int:
-        return len(text.split())
-
-    def add_message(self, role: str, content: str):
-        word_count = self._count_words(content)
-        self.messages.append({"role": role, "content": content, "words": word_count})
-        self.current_word_count += word_count
-
-        while self.current_word_count > self.max_words and len(self.messages) > 1:
-            oldest_msg = self.messages.popleft()
-            self.current_word_count -= oldest_msg["words"]
-
-    def generate_response(self, user_prompt: str) -> str:
-        self.add_message("user", user_prompt)
-        api_payload = [{"role": msg["role"], "content": msg["content"]} for msg in self.messages]
-
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=api_payload,
-                model="llama-3.3-70b-versatile", 
-            )
-            response_text = chat_completion.choices[0].message.content
-            self.add_message("assistant", response_text)
-            return response_text
-        except Exception as e:
-            return f"[Error connecting to Groq API: {e}]"
-
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+CHAT_COMPACTION = os.getenv("CHAT_COMPACTION") == "1"
+HISTORY_PAGE_SIZE = 10
 
 def init_session_state():
     defaults = {
-        "summary_history": [],
+        "history_page": 0,
+        "history_open_id": None,
+        "history_last_query": "",
         "current_file_name": None,
         "current_extracted_text": "",
         "manual_input_text": "",
         "last_summary": "",
+        "source_words": 0,
         "input_source": "file",
-        "last_uploaded_names": [],
+        "uploaded_keys": [],
+        "combined_keys": [],
+        "extracted_files": {},
+        "upload_keys_by_id": {},
         "chat_manager": None,
-        "chat_messages": []
+        "chat_messages": [],
+        "last_summary_timing": None,
+        "metrics_run": None,
+        "owner_id": None,
+        "active_job_id": None
     }
     for key, val in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = val
+    if st.session_state.owner_id is None:
+        st.session_state.owner_id = uuid.uuid4().hex
+    # A reloaded page reconnects to its job through the URL.
+    if st.session_state.active_job_id is None and "job" in st.query_params:
+        st.session_state.active_job_id = st.query_params["job"]
             
-    if not st.session_state.summary_history:
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    st.session_state.summary_history = json.load(f)
-            except:
-                pass
-
 def save_to_history(source_name: str, summary: str):
-    entry = {
-        "source_name": source_name,
-        "summary_preview": (summary[:150] + "…") if len(summary) > 150 else summary,
-        "full_summary": summary,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    st.session_state.summary_history.insert(0, entry)
-    st.session_state.summary_history = st.session_state.summary_history[:50]
-    
-    try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(st.session_state.summary_history, f, ensure_ascii=False, indent=2)
-    except:
-        pass
+    history_store().append(source_name, summary)
+    st.session_state.history_page = 0
 
 # ---------------------------------------------------------------------------
 # Data Processing Engines
 # ---------------------------------------------------------------------------
-def extract_text_from_pdf(file) -> str:
-    """Extracts PDF text robustly using a temporary file for RapidOCRPDF."""
-    temp_path = None
-    try:
-        # RapidOCRPDF requires a file path, safely create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file.getvalue())
-            temp_path = tmp.name
-            
-        pdf_extracter = RapidOCRPDF()
-        text_per_pages = pdf_extracter(temp_path)
-        data = "\n".join([str(t[1]) if isinstance(t, tuple) else str(t) for t in text_per_pages])
-        return data if data.strip() else "[No readable text found in PDF]"
-        
-    except Exception as e:
-        return f"[Error extracting PDF text: {str(e)}]"
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
-
-def extract_text_from_file(uploaded_file) -> str:
-    if uploaded_file is None: return ""
-    name = (uploaded_file.name or "").lower()
-    if name.endswith(".txt"):
-        return uploaded_file.getvalue().decode("utf-8", errors="replace")
-    elif name.endswith(".pdf"):
-        return extract_text_from_pdf(uploaded_file)
-    return "[Unsupported file type.]"
-
-def translate_massive_text_ui(raw_text, target_language='en', chunk_limit=4000):
-    translator = GoogleTranslator(source='auto', target=target_language)
-    text_chunks = textwrap.wrap(raw_text, width=chunk_limit, replace_whitespace=False)
-    translated_full_text = ""
-    
-    progress_bar = st.progress(0, text="Starting Translation...")
-    for i, chunk in enumerate(text_chunks):
-        try:
-            progress_bar.progress((i + 1) / len(text_chunks), text=f"Translating chunk {i+1}/{len(text_chunks)}...")
-            translated_full_text += translator.translate(chunk) + " "
-        except Exception as e:
-            st.warning(f"Failed to translate chunk {i + 1}. Error: {e}")
-            
-    progress_bar.empty()
-    return translated_full_text.strip()
-
-def summarize_in_chunks_ui(raw_text, client):
-    text_chunks = textwrap.wrap(raw_text, width=40000, replace_whitespace=False)
-    system_prompt = """
-    You are an expert content synthesizer. Summarize the provided text.
-    Focus on factual accuracy and eliminate fluff.
-    Be technical and precise
-    Style: Use concise paragraphs. Use ASCII art or bullet points to structure.
-    Do NOT be redundant.
-    """
-    full_summary = ""
+def uploaded_file_key(uploaded_file) -> str:
+    """Identity of an upload: its name plus a hash of its bytes, so re-uploads under the same name re-extract.
+    Hashes are remembered per Streamlit file_id so reruns do not re-read every file."""
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is not None and file_id in st.session_state.upload_keys_by_id:
+        return st.session_state.upload_keys_by_id[file_id]
+    key = f"{uploaded_file.name}:{hashlib.sha256(uploaded_file.getvalue()).hexdigest()[:16]}"
+    if file_id is not None:
+        st.session_state.upload_keys_by_id[file_id] = key
+    return key
+
+def combined_extracted_text() -> str:
+    """Joins the per-file texts in upload order, rebuilding only when the file set changed."""
+    keys = st.session_state.uploaded_keys
+    if st.session_state.combined_keys != keys:
+        extracted = st.session_state.extracted_files
+        st.session_state.current_extracted_text = PAGE_BREAK.join(extracted[k]["text"] for k in keys if k in extracted).strip()
+        st.session_state.combined_keys = keys
+    return st.session_state.current_extracted_text
+
+def translate_massive_text_ui(raw_text, target_language='en', chunk_limit=None, backend_name=None,
+                              source_language='auto'):
+    """Returns a generator of translated chunks, translated in the background while the caller
+    consumes them. Progress is shown by the consumer (the summarizer); failed chunks are marked in place."""
+    run = st.session_state.metrics_run
+    backend = get_backend(backend_name)
+
+    # The generator is read on a worker thread, so it must not touch st.session_state.
+    def translated_chunks():
+        with span("translate", run=run, backend=backend.name, bytes_in=len(raw_text.encode("utf-8")), streamed=True) as stats:
+            for chunk in stream_translate(raw_text.split(PAGE_BREAK), target_language=target_language,
+                                          source_language=source_language, max_bytes=chunk_limit, memory=translation_memory(), stats=stats,
+                                          backend=backend):
+                stats.add("chunks")
+                stats.add("bytes_out", len(chunk.encode("utf-8")))
+                stats.add("failed_chunks", chunk == TRANSLATION_ERROR_MARKER)
+                yield chunk
+    return translated_chunks()
+
+def summarize_in_chunks_ui(raw_text, client, mode="sections", stream=False):
+    """Summarizes chunks in parallel. mode="tree" merges them level by level into one
+    budget-sized summary, "sections" keeps one section per part.
+    raw_text may be a generator of pages; parts start as soon as enough text has arrived.
+    With stream=True part summaries are shown live as tokens arrive."""
     progress_bar = st.progress(0, text="Preparing Groq AI Summarization...")
+    start = time.perf_counter()
+    timing = {"ttft": None}
+
+    def on_progress(done, total):
+        progress_bar.progress(done / total, text=f"Summarized chunk {done}/{total} via Llama 3.3...")
+
+    def on_error(i, e):
+        st.error(f"Groq API Error on chunk {i + 1}: {e}")
+
+    on_token = None
+    if stream:
+        live = st.empty()
+        streamed = {}
+        last_render = [0.0]
+
+        def on_token(i, delta):
+            if delta is not None and timing["ttft"] is None:
+                timing["ttft"] = time.perf_counter() - start
+            streamed[i] = "" if delta is None else streamed.get(i, "") + delta
+            # Re-rendering on every token would dominate; refresh at most ~10 times a second.
+            if time.perf_counter() - last_render[0] > 0.1:
+                last_render[0] = time.perf_counter()
+                live.markdown("".join(
+                    f"\n\n**Part {k + 1}**\n\n{streamed[k]}" for k in sorted(streamed)
+                ))
+
+    def on_level(level, batch_count):
+        progress_bar.progress(1.0, text=f"Merging summaries (level {level}, {batch_count} batches)...")
+
+    part_timings, merge_timings = [], []
+    with span("summarize", run=st.session_state.metrics_run, mode=mode) as stats:
+        full_summary = summarize_text(
+            raw_text, client, mode=mode,
+            limiter=shared_limiter(),
+            cache=summary_cache(),
+            on_progress=on_progress,
+            on_error=on_error,
+            on_token=on_token,
+            on_level=on_level,
+            on_merge_error=lambda i, e: st.error(f"Groq API Error while merging batch {i + 1}: {e}"),
+            timings=part_timings,
+            merge_timings=merge_timings,
+        )
+        stats.set(**summary_stats(part_timings, merge_timings))
+    if stream:
+        live.empty()
 
-    for i, chunk in enumerate(text_chunks):
-        progress_bar.progress((i + 1) / len(text_chunks), text=f"Summarizing chunk {i+1}/{len(text_chunks)} via Llama 3.3...")
-        try:
-            completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": chunk}
-                ]
-            )
-            chunk_summary = completion.choices[0].message.content
-            full_summary += f"\n\n--- Summary of Part {i + 1} ---\n" + chunk_summary
-            
-            if i < len(text_chunks) - 1:
-                time.sleep(1.2) # Groq rate limit safety buffer
-                
-        except Exception as e:
-            st.error(f"Groq API Error on chunk {i + 1}: {e}")
-            break
-            
     progress_bar.empty()
+    latency = time.perf_counter() - start
+    st.session_state.last_summary_timing = {"ttft": timing["ttft"] if timing["ttft"] is not None else latency, "latency": latency}
     return full_summary
 
 # ---------------------------------------------------------------------------
@@ -430,42 +417,88 @@ def render_sidebar():
     with st.sidebar:
         st.markdown("### Dashboard")
         st.markdown("---")
-        if not st.session_state.summary_history:
-            st.markdown("""<div style='text-align:center; color:#94a3b8; padding:2rem;'>No summaries yet.</div>""", unsafe_allow_html=True)
+        store = history_store()
+        query = st.text_input("Search history", key="history_query", placeholder="Search summaries...")
+        if query != st.session_state.history_last_query:
+            st.session_state.history_last_query = query
+            st.session_state.history_page = 0
+
+        total = store.search_count(query)
+        if not total:
+            message = "No matching summaries." if query.strip() else "No summaries yet."
+            st.markdown(f"""<div style='text-align:center; color:#94a3b8; padding:2rem;'>{message}</div>""", unsafe_allow_html=True)
         else:
-            for i, entry in enumerate(st.session_state.summary_history):
+            page_count = math.ceil(total / HISTORY_PAGE_SIZE)
+            page = min(st.session_state.history_page, page_count - 1)
+            # Only this page's previews are read; a full summary is fetched when its entry is opened.
+            for entry in store.search(query, HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE):
                 with st.expander(f"{entry['source_name']} - {entry['timestamp']}", expanded=False):
                     st.markdown(f"**Preview:** {entry['summary_preview']}")
-                    st.text_area("Summary", entry['full_summary'], height=150, disabled=True, key=f"hist_{i}")
+                    is_open = st.session_state.history_open_id == entry['id']
+                    if st.button("Hide summary" if is_open else "Show full summary", key=f"hist_toggle_{entry['id']}"):
+                        st.session_state.history_open_id = None if is_open else entry['id']
+                        st.rerun()
+                    if is_open:
+                        st.text_area("Summary", store.get_summary(entry['id']), height=150, disabled=True, key=f"hist_{entry['id']}")
+
+            if page_count > 1:
+                prev_col, page_col, next_col = st.columns([1, 1, 1])
+                with prev_col:
+                    if st.button("‹", disabled=page == 0, key="hist_prev"):
+                        st.session_state.history_page = page - 1
+                        st.rerun()
+                with page_col:
+                    st.caption(f"{page + 1} / {page_count}")
+                with next_col:
+                    if st.button("›", disabled=page >= page_count - 1, key="hist_next"):
+                        st.session_state.history_page = page + 1
+                        st.rerun()
         
         if st.button("Clear History", use_container_width=True):
-            st.session_state.summary_history = []
-            if os.path.exists(HISTORY_FILE): os.remove(HISTORY_FILE)
+            store.clear()
+            st.session_state.history_page = 0
+            st.session_state.history_open_id = None
             st.rerun()
 
 def render_file_upload_tab():
+    """Returns the uploaded files and the chosen OCR quality."""
     st.markdown('<h2 class="upload-section-heading">Upload Files</h2>', unsafe_allow_html=True)
     uploaded_files = st.file_uploader(
         "Drag and drop files here or click to browse",
-        type=["pdf", "txt"], accept_multiple_files=True
+        type=[ext.lstrip(".") for ext in SUPPORTED_EXTENSIONS], accept_multiple_files=True
+    )
+    qualities = list(OCR_TIERS) + ["auto"]
+    quality = st.selectbox(
+        "OCR quality (scanned pages)", qualities, index=qualities.index(OCR_QUALITY) if OCR_QUALITY in qualities else 1,
+        help="fast: ~1.6x quicker on dense pages, fine for clean upright scans. accurate: 300 DPI for faint or small print. auto: chosen per page.",
     )
     
     if uploaded_files:
-        current_names = sorted(f.name for f in uploaded_files)
-        if st.session_state.get("last_uploaded_names") != current_names:
-            combined_parts = []
-            with st.spinner("Extracting text..."):
-                for f in uploaded_files:
-                    combined_parts.append(extract_text_from_file(f))
-            st.session_state.current_extracted_text = "\n\n".join(combined_parts).strip()
+        # Changing the OCR quality re-extracts (the text depends on it).
+        keys = [f"{uploaded_file_key(f)}:{quality}" for f in uploaded_files]
+        extracted = st.session_state.extracted_files
+        for key in set(extracted) - set(keys):
+            del extracted[key]
+
+        # In job mode the files are extracted by the job, so a long scan never blocks the page.
+        new_files = [(f, key) for f, key in zip(uploaded_files, keys) if key not in extracted]
+        if new_files and not USE_JOBS:
+            with st.spinner(f"Extracting text from {len(new_files)} new file(s)..."):
+                # Images among them are OCR'd together, in shared batches.
+                results = extract_documents([(f.name, f.getvalue()) for f, _ in new_files], cache=ocr_cache(),
+                                            quality=quality, workers=EXTRACT_WORKERS)
+                for (_, key), result in zip(new_files, results):
+                    extracted[key] = result
+
+        if st.session_state.uploaded_keys != keys:
+            st.session_state.uploaded_keys = keys
             st.session_state.current_file_name = ", ".join(f.name for f in uploaded_files)
-            st.session_state.last_uploaded_names = current_names
             st.session_state.input_source = "file"
-        
+
         st.markdown('<p class="section-heading-small">Selected Files</p>', unsafe_allow_html=True)
-        for f in uploaded_files:
+        for f, key in zip(uploaded_files, keys):
             size_mb = len(f.getvalue()) / 1024 / 1024
-            icon = "pdf" if f.name.lower().endswith('.pdf') else "txt"
+            icon = "pdf" if f.name.lower().endswith('.pdf') else "img" if f.name.lower().endswith(IMAGE_EXTENSIONS) else "txt"
             st.markdown(f"""
                 <div class="file-card">
                     <span class="file-card-icon {icon}">{icon.upper()}</span>
@@ -473,17 +506,104 @@ def render_file_upload_tab():
                     <span class="file-card-size">{size_mb:.2f} MB</span>
                 </div>
             """, unsafe_allow_html=True)
+            report = extracted.get(key, {}).get("report")
+            if report:
+                st.caption(report)
             
-        if st.session_state.current_extracted_text and not st.session_state.current_extracted_text.startswith("[Error"):
+        extracted_text = combined_extracted_text()
+        if extracted_text and not extracted_text.startswith("[Error"):
             with st.expander("View Extracted Text Preview"):
-                preview = st.session_state.current_extracted_text[:2000]
+                preview = extracted_text[:2000]
                 st.markdown(f'<div class="preview-container">{preview}...</div>', unsafe_allow_html=True)
+        if USE_JOBS:
+            st.caption("Text is extracted in the background when you generate the summary.")
     else:
         st.session_state.current_file_name = None
         st.session_state.current_extracted_text = ""
-        st.session_state.last_uploaded_names = []
+        st.session_state.uploaded_keys = []
+        st.session_state.combined_keys = []
+        st.session_state.extracted_files = {}
+        st.session_state.upload_keys_by_id = {}
+    return uploaded_files or [], quality
+
+def render_metrics_panel():
+    """Per-stage breakdown of the current summary run (and the chat turns since)."""
+    run = st.session_state.metrics_run
+    if run is None:
+        return
+    with st.expander("⏱ Run breakdown"):
+        rows = run.breakdown()
+        for row in rows:
+            row["seconds"] = round(row["seconds"], 3)
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        st.caption("Seconds are wall time per stage; translation and summarization overlap when both run. "
+                   "wait is cumulative time spent in rate-limit pacing and retry backoff.")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.download_button("Spans (JSONL)", "\n".join(json.dumps(r, ensure_ascii=False) for r in run.spans),
+                               file_name=f"precis_run_{run.id}.jsonl", use_container_width=True)
+        with col_b:
+            st.download_button("Prometheus export", prometheus_text(), file_name="precis_metrics.prom",
+                               use_container_width=True)
+
+def start_chat(summary, working_text, client, run, source_words):
+    """Phase 2: Initialize Chat Memory for a new summary."""
+    st.session_state.last_summary = summary
+    st.session_state.source_words = source_words
+    st.session_state.chat_manager = FastContextManager(
+        compaction=CHAT_COMPACTION, client=client,
+        retriever=build_index(working_text), metrics_run=run,
+    )
+    system_instruction = f"You are an expert analytical assistant. Be technical and precise. Base all your answers strictly on this document summary and on the source excerpts provided with each question:\n{summary}"
+    st.session_state.chat_manager.add_message("system", system_instruction)
+    st.session_state.chat_messages = []
+
+def render_active_job(client):
+    """Progress of the background job of this session; polls until it finishes, then loads the result."""
+    job_id = st.session_state.active_job_id
+    job = job_store().get(job_id)
+    if job is None:
+        st.session_state.active_job_id = None
+        st.query_params.pop("job", None)
+        return
+
+    if job["status"] in ("queued", "running"):
+        st.markdown('<h2 class="section-heading">Summary Output</h2>', unsafe_allow_html=True)
+        if job["status"] == "queued":
+            st.info(f"Queued · {job_store().queue_position(job_id)} job(s) ahead")
+        st.progress(job["progress"], text=job["message"] or "Working...")
+        if job.get("partial"):
+            st.markdown(job["partial"])
+        if st.button("Cancel", key="cancel_job"):
+            job_store().cancel(job_id)
+        st.caption(f"Job {job_id} · you can reload this page or come back later; the summary keeps running.")
+        time.sleep(1)
+        st.rerun()
+
+    st.session_state.active_job_id = None
+    st.query_params.pop("job", None)
+    if job["status"] == "done":
+        meta = job["result_meta"]
+        run = st.session_state.metrics_run
+        if run is None or run.label != job["params"].get("source_name"):
+            run = st.session_state.metrics_run = Run(job["params"].get("source_name", ""))
+        for record in meta["spans"]:
+            run.add(record)
+        for report in meta.get("extraction", []):
+            st.caption(report)
+        for warning in meta["warnings"]:
+            st.warning(warning)
+        st.session_state.last_summary_timing = None
+        st.session_state.history_page = 0
+        start_chat(job["result"], meta["text"], client, run, meta.get("source_words", 0))
+    elif job["status"] == "error":
+        st.error(f"Summary failed: {job['error']}")
+    else:
+        st.warning("Summary cancelled.")
 
 def main():
+    if os.getenv("PRECIS_OCR_PREWARM") == "1":
+        prewarm_ocr()
     init_session_state()
     render_sidebar()
     
@@ -501,16 +621,18 @@ def main():
         st.stop()
         
     groq_client = Groq(api_key=groq_api_key)
+    if USE_JOBS and JOB_WORKERS > 0:
+        start_workers(JOB_WORKERS)
     
     tab1, tab2 = st.tabs(["Upload File", "Enter Text"])
-    with tab1: render_file_upload_tab()
+    with tab1: uploaded_files, ocr_quality = render_file_upload_tab()
     with tab2:
         st.markdown('<h2 class="section-heading">Enter Text</h2>', unsafe_allow_html=True)
         manual_text = st.text_area("Content", value=st.session_state.manual_input_text, height=400)
         st.session_state.manual_input_text = manual_text
         if manual_text.strip(): st.session_state.input_source = "manual"
 
-    current_text = st.session_state.current_extracted_text if st.session_state.input_source == "file" else st.session_state.manual_input_text
+    current_text = combined_extracted_text() if st.session_state.input_source == "file" else st.session_state.manual_input_text
     source_name = st.session_state.current_file_name if st.session_state.input_source == "file" else "Manual Input"
 
     st.markdown("---")
@@ -519,36 +641,81 @@ def main():
     col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
         translate_toggle = st.checkbox("🌐 Translate to English before summarizing")
+        translator_name, source_language = TRANSLATE_BACKEND, "auto"
+        if translate_toggle:
+            names = list(BACKENDS)
+            translator_name = st.selectbox(
+                "Translation engine", names, index=names.index(TRANSLATE_BACKEND) if TRANSLATE_BACKEND in names else 0,
+                help="google: Google Translate over the network. argos: local offline models (first use loads the model).",
+            )
+            source_language = st.selectbox(
+                "Source language", SOURCE_LANGUAGES,
+                help="auto lets Google detect it; argos needs the language unless exactly one model into English is installed "
+                     "(a missing model is downloaded on first use).",
+            )
+        stream_toggle = st.checkbox("⚡ Stream output as it is generated", value=True)
     with col2:
         generate_clicked = st.button("Generate Summary", type="primary", use_container_width=True)
+    with col3:
+        condensed_toggle = st.checkbox("🌳 Condensed summary (tree-reduce)", help="Merge part summaries into a single fixed-size summary. Recommended for books and very long documents.")
 
     if generate_clicked:
-        if current_text.strip() and not current_text.startswith("[Error"):
+        # Uploads in job mode are not extracted yet; the job gets the files themselves.
+        upload_job = USE_JOBS and st.session_state.input_source == "file" and bool(uploaded_files)
+        if upload_job or (current_text.strip() and not current_text.startswith("[Error")):
             working_text = current_text
-            
-            if translate_toggle:
-                working_text = translate_massive_text_ui(working_text)
-                
-            summary_output = summarize_in_chunks_ui(working_text, groq_client)
-            st.session_state.last_summary = summary_output
-            save_to_history(source_name, summary_output)
-            
-            # Phase 2: Initialize Chat Memory automatically upon new summary
-            st.session_state.chat_manager = FastContextManager(max_words=10000)
-            system_instruction = f"You are an expert analytical assistant. Be technical and precise. Base all your answers strictly on this document summary:\n{summary_output}"
-            st.session_state.chat_manager.add_message("system", system_instruction)
-            st.session_state.chat_messages = []
+            mode = "tree" if condensed_toggle else "sections"
+            run = st.session_state.metrics_run = Run(source_name)
+            if st.session_state.input_source == "file" and not upload_job:
+                # Extraction ran at upload time; its spans are part of this document's breakdown.
+                for key in st.session_state.uploaded_keys:
+                    record = st.session_state.extracted_files[key].get("span")
+                    if record:
+                        run.add(record)
+
+            if USE_JOBS:
+                # Heavy work runs in the job workers; the session only polls (see render_active_job).
+                params = {"source_name": source_name, "mode": mode, "translate": translate_toggle,
+                          "translator": translator_name, "source_language": source_language, "target_language": "en", "ocr_quality": ocr_quality,
+                          "stream": stream_toggle}
+                files = [(f.name, f.getvalue()) for f in uploaded_files] if upload_job else None
+                job_id = job_store().submit(st.session_state.owner_id, "" if files else working_text, params, files=files)
+                st.session_state.active_job_id = job_id
+                st.query_params["job"] = job_id
+                st.session_state.last_summary = ""
+            else:
+                if translate_toggle:
+                    # Translation and summarization overlap: parts are summarized while later pages are still being translated.
+                    translated = []
+                    pages = collect(translate_massive_text_ui(working_text, backend_name=translator_name,
+                                                              source_language=source_language), translated)
+                    try:
+                        summary_output = summarize_in_chunks_ui(pages, groq_client, mode=mode, stream=stream_toggle)
+                    except TranslationFailed as e:
+                        st.error(f"Translation failed, nothing was summarized. {e}")
+                        st.stop()
+                    working_text = "\n\n".join(translated)
+                    failed = translated.count(TRANSLATION_ERROR_MARKER)
+                    if failed:
+                        st.warning(f"Failed to translate {failed} chunk(s); they are marked in the text.")
+                else:
+                    summary_output = summarize_in_chunks_ui(working_text, groq_client, mode=mode, stream=stream_toggle)
+                save_to_history(source_name, summary_output)
+                start_chat(summary_output, working_text, groq_client, run, len(current_text.split()))
             st.rerun()
         else:
             st.warning("Please provide valid text content first.")
 
+    if st.session_state.active_job_id:
+        render_active_job(groq_client)
+
     # Render Output & Phase 2 (Chat)
     if st.session_state.last_summary:
         st.markdown('<h2 class="section-heading">Summary Output</h2>', unsafe_allow_html=True)
         st.markdown(f"""
         <div class="summary-card">
             <div>
-                <span class="stat-badge">Original Source Length: {len(current_text.split()):,} words</span>
+                <span class="stat-badge">Original Source Length: {st.session_state.source_words:,} words</span>
                 <span class="stat-badge">Summary Length: {len(st.session_state.last_summary.split()):,} words</span>
             </div>
             <div style="margin-top: 1.5rem; line-height: 1.8; color: #ddd8cc; white-space: pre-wrap;">
@@ -556,6 +723,10 @@ def main():
             </div>
         </div>
         """, unsafe_allow_html=True)
+        timing = st.session_state.last_summary_timing
+        if timing:
+            st.caption(f"First token after {timing['ttft']:.2f}s · completed in {timing['latency']:.2f}s")
+        render_metrics_panel()
         
         # Interactive Chat Section
         st.markdown("---")
@@ -573,9 +744,16 @@ def main():
                 st.markdown(prompt)
                 
             with st.chat_message("assistant"):
-                with st.spinner("Analyzing context..."):
-                    reply = st.session_state.chat_manager.generate_response(prompt)
-                    st.markdown(reply)
+                chat_manager = st.session_state.chat_manager
+                chat_manager.last_timing = None
+                if stream_toggle:
+                    reply = st.write_stream(chat_manager.generate_response_stream(prompt))
+                else:
+                    with st.spinner("Analyzing context..."):
+                        reply = chat_manager.generate_response(prompt)
+                        st.markdown(reply)
+                if chat_manager.last_timing:
+                    st.caption(f"First token after {chat_manager.last_timing['ttft']:.2f}s · completed in {chat_manager.last_timing['latency']:.2f}s")
             st.session_state.chat_messages.append({"role": "assistant", "content": reply})
 
     st.markdown("""<div style="text-align:center; padding: 2rem; color: #64748b;">Précis © 2026</div>""", unsafe_allow_html=True)
@@ -0,0 +1,378 @@
+"""
+Précis - Translation Engine
+Translates chunked text on a thread pool with per-chunk retry and backoff.
+Results are reassembled in document order; chunks that still fail are marked in place.
+A persistent translation memory serves repeated paragraphs (footers, letterheads,
+standard clauses) without calling the translator.
+Two backends: Google (deep-translator, one HTTP request per chunk) and Argos (local
+offline models, loaded once per process and fed sentence batches).
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from cache import make_key, shared_cache
+from chunking import TRANSLATE_CHUNK_BYTES, iter_chunks, split_paragraphs, split_sentences
+from pipeline import labelled, ordered_map, prefetch, spawn_context
+from summarizer import call_with_retry
+
+TRANSLATE_WORKERS = int(os.getenv("TRANSLATE_WORKERS", "4"))
+
+# "google" or "argos".
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "google")
+
+TRANSLATION_ERROR_MARKER = "[TRANSLATION ERROR IN THIS SECTION]"
+
+# Offered by the UI; Argos needs a real source unless exactly one model into the target is installed.
+SOURCE_LANGUAGES = ["auto", "ar", "de", "es", "fr", "hi", "it", "ja", "ko", "nl", "pl", "pt", "ru", "tr", "uk", "zh"]
+
+TRANSLATION_MEMORY_MB = int(os.getenv("TRANSLATION_MEMORY_MB", "128"))
+
+# Argos has no request limit, so chunks only need to be small enough to spread over workers.
+ARGOS_CHUNK_BYTES = 20000
+# Sentences are sent to the model in batches of about this many characters.
+ARGOS_BATCH_CHARS = int(os.getenv("ARGOS_BATCH_CHARS", "1500"))
+# Worker processes for Argos; 1 translates in this process.
+ARGOS_WORKERS = int(os.getenv("ARGOS_WORKERS", "1"))
+# Download a missing language pair from the Argos package index on first use.
+ARGOS_AUTO_INSTALL = os.getenv("ARGOS_AUTO_INSTALL", "1") == "1"
+
+_local = threading.local()
+
+
+class TranslationFailed(RuntimeError):
+    """Every chunk of a text failed to translate."""
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+def _thread_translator(source_language: str, target_language: str):
+    """GoogleTranslator keeps per-request state on the instance, so each worker thread gets its own."""
+    from deep_translator import GoogleTranslator
+
+    translators = getattr(_local, "translators", None)
+    if translators is None:
+        translators = _local.translators = {}
+    pair = (source_language, target_language)
+    if pair not in translators:
+        translators[pair] = GoogleTranslator(source=source_language, target=target_language)
+    return translators[pair]
+
+
+class GoogleBackend:
+    """Google Translate through deep-translator. Network errors are retried."""
+    name = "google"
+    chunk_bytes = TRANSLATE_CHUNK_BYTES
+    retry_errors = True
+
+    def translate(self, text: str, source_language: str, target_language: str) -> str:
+        translated = _thread_translator(source_language, target_language).translate(text)
+        if translated is None:
+            raise RuntimeError("Translator returned no text.")
+        return translated
+
+
+_argos_translations = {}
+_argos_lock = threading.Lock()
+
+
+def _argos_translation(source_language: str, target_language: str):
+    """Loads an Argos language pair once per process, installing its package if allowed."""
+    key = (source_language, target_language)
+    with _argos_lock:
+        if key in _argos_translations:
+            return _argos_translations[key]
+        import argostranslate.package
+        import argostranslate.translate
+
+        def find():
+            languages = {lang.code: lang for lang in argostranslate.translate.get_installed_languages()}
+            if source_language in languages and target_language in languages:
+                return languages[source_language].get_translation(languages[target_language])
+            return None
+
+        translation = find()
+        if translation is None and ARGOS_AUTO_INSTALL:
+            argostranslate.package.update_package_index()
+            package = next((p for p in argostranslate.package.get_available_packages()
+                            if p.from_code == source_language and p.to_code == target_language), None)
+            if package is not None:
+                argostranslate.package.install_from_path(package.download())
+                translation = find()
+        if translation is None:
+            raise RuntimeError(f"No Argos model installed for {source_language} -> {target_language}.")
+        _argos_translations[key] = translation
+        return translation
+
+
+def _argos_installed_sources(target_language: str) -> list:
+    import argostranslate.package
+    return sorted({p.from_code for p in argostranslate.package.get_installed_packages() if p.to_code == target_language})
+
+
+def _argos_translate_batches(source_language: str, target_language: str, batches: list) -> list:
+    translation = _argos_translation(source_language, target_language)
+    return [translation.translate(batch) for batch in batches]
+
+
+def _sentence_batches(paragraph: str, max_chars: int) -> list:
+    """Consecutive sentences of a paragraph grouped into batches of about max_chars."""
+    batches, current = [], ""
+    for sentence in split_sentences(paragraph):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            batches.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ArgosBackend:
+    """
+    Offline translation with Argos Translate. The model is loaded once per process.
+    Text is translated paragraph by paragraph in sentence batches; with workers > 1 the
+    batches of a chunk are spread over that many processes, each with its own loaded model.
+    Argos needs a real source language: "auto" resolves to the only installed package
+    into the target language, and fails if there is more than one.
+    """
+    name = "argos"
+    chunk_bytes = ARGOS_CHUNK_BYTES
+    retry_errors = False
+
+    def __init__(self, workers: int = ARGOS_WORKERS, batch_chars: int = ARGOS_BATCH_CHARS):
+        self.workers = max(1, workers)
+        self.batch_chars = batch_chars
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def resolve_source(self, source_language: str, target_language: str) -> str:
+        if source_language != "auto":
+            return source_language
+        sources = _argos_installed_sources(target_language)
+        if len(sources) != 1:
+            raise RuntimeError(
+                f"Argos cannot detect the source language; choose one of {sources or 'the installable languages'}."
+            )
+        return sources[0]
+
+    def _worker_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=spawn_context())
+            return self._pool
+
+    def warm(self, source_language: str, target_language: str):
+        """Loads the model now (also in the worker processes) instead of on the first request."""
+        source_language = self.resolve_source(source_language, target_language)
+        if self.workers == 1:
+            _argos_translation(source_language, target_language)
+            return
+        pool = self._worker_pool()
+        for future in [pool.submit(_argos_translate_batches, source_language, target_language, [])
+                       for _ in range(self.workers)]:
+            future.result()
+
+    def translate(self, text: str, source_language: str, target_language: str) -> str:
+        paragraphs = split_paragraphs(text)
+        batches, owners = [], []
+        for index, paragraph in enumerate(paragraphs):
+            for batch in _sentence_batches(paragraph, self.batch_chars):
+                batches.append(batch)
+                owners.append(index)
+        if not batches:
+            return ""  # empty or whitespace-only text
+        source_language = self.resolve_source(source_language, target_language)
+
+        if self.workers == 1 or len(batches) == 1:
+            results = _argos_translate_batches(source_language, target_language, batches)
+        else:
+            step = -(-len(batches) // self.workers)
+            pool = self._worker_pool()
+            futures = [pool.submit(_argos_translate_batches, source_language, target_language, batches[i:i + step])
+                       for i in range(0, len(batches), step)]
+            results = [result for future in futures for result in future.result()]
+
+        # Paragraph structure is kept, so the translation memory can align paragraphs.
+        parts = [[] for _ in paragraphs]
+        for index, result in zip(owners, results):
+            parts[index].append(result.strip())
+        return "\n\n".join(" ".join(part) for part in parts)
+
+
+BACKENDS = {"google": GoogleBackend, "argos": ArgosBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = None):
+    """Process-wide backend instance by name (default TRANSLATE_BACKEND)."""
+    name = (name or TRANSLATE_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend {name!r}; choose one of {', '.join(BACKENDS)}.")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+# ---------------------------------------------------------------------------
+# Translation
+# ---------------------------------------------------------------------------
+def translation_memory():
+    """Process-wide on-disk translation memory."""
+    return shared_cache("translations", max_bytes=TRANSLATION_MEMORY_MB * 1024 * 1024)
+
+
+def _memory_key(paragraph: str, source_language: str, target_language: str, backend) -> str:
+    # Whitespace differences (re-wrapped lines, OCR spacing) should still hit.
+    return make_key(" ".join(paragraph.split()), source_language, target_language, backend.name)
+
+
+def _translate_text(text: str, target_language: str, source_language: str, max_retries: int, stats=None,
+                    backend=None) -> str:
+    backend = backend or get_backend()
+
+    def request():
+        if stats is not None:
+            stats.add("requests")
+        return backend.translate(text, source_language, target_language)
+
+    on_retry = (lambda e, delay: stats.add("retries")) if stats is not None else None
+    # A local model fails the same way every time; only network backends are retried.
+    return call_with_retry(request, max_retries=max_retries if backend.retry_errors else 0,
+                           retryable=lambda e: True, on_retry=on_retry)
+
+
+def translate_chunk(chunk: str, target_language: str = 'en', source_language: str = 'auto',
+                    max_retries: int = 3, memory=None, stats=None, backend=None) -> str:
+    """
+    Translates one chunk, retrying any translator error with jittered backoff.
+    With a memory, paragraphs already translated are reused and only the rest is sent,
+    in a single request.
+    stats, if given, is an object with add(name, amount) (e.g. a metrics span) that counts
+    requests, retries and memory_hits; it must be thread-safe.
+    backend defaults to get_backend().
+    """
+    backend = backend or get_backend()
+    if memory is None:
+        return _translate_text(chunk, target_language, source_language, max_retries, stats, backend)
+
+    paragraphs = split_paragraphs(chunk)
+    keys = [_memory_key(p, source_language, target_language, backend) for p in paragraphs]
+    results = [memory.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if stats is not None:
+        stats.add("memory_hits", len(paragraphs) - len(missing))
+    if not missing:
+        return "\n\n".join(results)
+
+    translated = _translate_text(
+        "\n\n".join(paragraphs[i] for i in missing), target_language, source_language, max_retries, stats, backend
+    )
+    parts = split_paragraphs(translated)
+    if len(parts) != len(missing):
+        # The translator merged or split paragraphs, so they cannot be aligned for the memory.
+        if len(missing) == len(paragraphs):
+            return translated
+        parts = [_translate_text(paragraphs[i], target_language, source_language, max_retries, stats, backend)
+                 for i in missing]
+
+    for i, part in zip(missing, parts):
+        results[i] = part
+        memory.set(keys[i], part)
+    return "\n\n".join(results)
+
+
+def translate_chunks(chunks, target_language: str = 'en', source_language: str = 'auto',
+                     max_workers: int = TRANSLATE_WORKERS, max_retries: int = 3, memory=None,
+                     on_progress=None, on_error=None, stats=None, backend=None) -> list:
+    """
+    Translates chunks concurrently and returns them in document order.
+    A chunk that fails every retry is replaced by TRANSLATION_ERROR_MARKER and reported
+    through on_error(index, exc). Callbacks run on the calling thread.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {}
+        for i, chunk in enumerate(chunks):
+            futures[pool.submit(translate_chunk, chunk, target_language, source_language, max_retries, memory,
+                                stats, backend)] = i
+
+        results = [TRANSLATION_ERROR_MARKER] * len(futures)
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if on_error:
+                    on_error(i, e)
+            if on_progress:
+                on_progress(done, len(futures))
+    return results
+
+
+def translate_text(text: str, target_language: str = 'en', source_language: str = 'auto',
+                   max_bytes: int = None, memory=None,
+                   on_progress=None, on_error=None, stats=None, backend=None) -> str:
+    """Chunks and translates a whole document, joining the chunks back in order.
+    max_bytes defaults to the backend's chunk size."""
+    backend = backend or get_backend()
+    translated_chunks = translate_chunks(
+        iter_chunks(text, max_bytes=max_bytes or backend.chunk_bytes), target_language=target_language,
+        source_language=source_language, memory=memory,
+        on_progress=on_progress, on_error=on_error, stats=stats, backend=backend,
+    )
+    return "\n\n".join(translated_chunks).strip()
+
+
+def stream_translate(pages, target_language: str = 'en', source_language: str = 'auto',
+                     max_bytes: int = None, max_workers: int = TRANSLATE_WORKERS,
+                     memory=None, on_error=None, lookahead: int = 4, stats=None, backend=None):
+    """
+    Translates an iterable of pages as it arrives, yielding translated chunks in document order.
+    Reading pages, translating and the consumer overlap: translation runs on a background
+    thread at most `lookahead` chunks ahead of the consumer, so a slow consumer (the
+    summarizer) throttles it and, through it, page extraction.
+    Failed chunks become TRANSLATION_ERROR_MARKER; on_error(index, exc) runs on that thread.
+    Markers are held back until a chunk succeeds: if none does, TranslationFailed is raised
+    instead, so a summarizer is never fed markers alone.
+    stats and backend are passed to translate_chunk; max_bytes defaults to the backend's chunk size.
+    """
+    backend = backend or get_backend()
+    errors = []
+
+    def translate_one(item):
+        i, chunk = item
+        try:
+            return translate_chunk(chunk, target_language, source_language, memory=memory, stats=stats,
+                                   backend=backend)
+        except Exception as e:
+            errors.append(e)
+            if on_error:
+                on_error(i, e)
+            return TRANSLATION_ERROR_MARKER
+
+    chunks = enumerate(iter_chunks(pages, max_bytes=max_bytes or backend.chunk_bytes))
+    translated = prefetch(labelled(ordered_map(translate_one, chunks, max_workers), "translate"), lookahead)
+    return _unless_all_failed(translated, errors)
+
+
+def _unless_all_failed(chunks, errors: list):
+    held = []
+    succeeded = False
+    try:
+        for chunk in chunks:
+            if not succeeded and chunk == TRANSLATION_ERROR_MARKER:
+                held.append(chunk)
+                continue
+            succeeded = True
+            yield from held
+            held.clear()
+            yield chunk
+    finally:
+        chunks.close()  # a consumer that stops early stops the translation thread too
+    if held:
+        raise TranslationFailed(f"All {len(held)} chunk(s) failed to translate: {errors[0] if errors else 'unknown error'}")